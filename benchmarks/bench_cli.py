@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+import time
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from github import FakeGitHub, latency_option
+from labelord import cli
+
+
+BENCHMARKS = {
+    'list-repos': ['list_repos'],
+    'list-labels': ['list_labels', 'MarekSuchanek/repo0'],
+    'run-update': ['run', 'update', '-a'],
+    'run-replace': ['run', 'replace', '-a'],
+}
+
+
+def write_config(directory, repos, labels):
+    # a quarter of labels is missing, a quarter has different color and some labels are new
+    lines = ['[github]', 'token = benchmark', '[repos]']
+    for i in range(repos):
+        lines.append('MarekSuchanek/repo{} = on'.format(i))
+    lines.append('[labels]')
+    for i in range(labels):
+        if i % 4 == 1:
+            lines.append('label{} = 000000'.format(i))
+        elif i % 4 != 0:
+            lines.append('label{} = ABC{}'.format(i, i + 100))
+    for i in range(labels // 4):
+        lines.append('new{} = FFFFFF'.format(i))
+    path = os.path.join(directory, 'config.cfg')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def run_child(args):
+    # output of labelord is not interesting, just its speed
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        cli.main(args, obj={})
+    except SystemExit as e:
+        os._exit(e.code or 0)
+    os._exit(0)
+
+
+def measure(github, args):
+    # labelord runs in forked process so peak RSS of each benchmark is measured separately
+    requests_before = github.requests()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        run_child(args)
+    _, status, rusage = os.wait4(pid, 0)
+    elapsed = time.perf_counter() - start
+    return {
+        'exit_code': os.WEXITSTATUS(status),
+        'requests': github.requests() - requests_before,
+        'wall': elapsed,
+        'rss': rusage.ru_maxrss / 1024,
+    }
+
+
+@click.command()
+@click.option('-n', '--repos', default=100, type=click.IntRange(1, None), help='Number of repositories.')
+@click.option('-m', '--labels', default=100, type=click.IntRange(1, None), help='Number of labels in repository.')
+@click.option('--page-size', default=100, type=click.IntRange(1, None), help='Items per page of listings.')
+@latency_option
+@click.option('--error-rate', default=0.0, type=float, help='Fraction of requests failed with 500.')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(1, None), help='Jobs of labelord run.')
+@click.option('-b', '--benchmark', multiple=True, type=click.Choice(sorted(BENCHMARKS)),
+              help='Benchmark to run (all by default).')
+def bench_cli(repos, labels, page_size, latency, error_rate, jobs, benchmark):
+    """Measure labelord commands end to end against local GitHub API stand-in."""
+    github = FakeGitHub(repos, labels, page_size, latency, error_rate).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            options = ['-c', write_config(directory, repos, labels), '--api-url', github.url,
+                       '--cache-dir', directory, '--no-cache', '--retry-backoff', '0']
+            click.echo('{} repos x {} labels, page size {}, error rate {}'.format(repos, labels, page_size, error_rate))
+            for name in benchmark or sorted(BENCHMARKS):
+                args = options + BENCHMARKS[name]
+                if name.startswith('run'):
+                    args = args + ['-j', str(jobs)]
+                result = measure(github, args)
+                click.echo('{:<12} exit {}: {:8.3f} s, {:6} requests, {:9.1f} req/s, peak RSS {:.1f} MB'.format(
+                    name, result['exit_code'], result['wall'], result['requests'],
+                    result['requests'] / result['wall'], result['rss']))
+    finally:
+        github.stop()
+
+
+if __name__ == '__main__':
+    bench_cli()
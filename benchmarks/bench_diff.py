@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from labelord import label_operations
+
+
+def generate_labels(count, variant):
+    # labels of one repository, some of them differ from template in color, case or are missing
+    labels = []
+    for i in range(count):
+        name = 'label{}'.format(i)
+        color = '{:06X}'.format(i)
+        if i % 7 == variant % 7:
+            color = 'FFFFFF'
+        if i % 11 == variant % 11:
+            name = name.upper()
+        if i % 13 == variant % 13:
+            continue
+        labels.append({'name': name, 'color': color})
+    labels.append({'name': 'extra{}'.format(variant), 'color': '000000'})
+    return labels
+
+
+@click.command()
+@click.option('-l', '--labels', default=10000, type=click.IntRange(1, None), help='Number of labels in template.')
+@click.option('-r', '--repos', default=1000, type=click.IntRange(1, None), help='Number of repositories.')
+@click.option('-m', '--mode', default='replace', type=click.Choice(['update', 'replace']))
+def bench_diff(labels, repos, mode):
+    """Measure diff of template labels against labels of many repositories."""
+    new_labels = {'label{}'.format(i): '{:06X}'.format(i) for i in range(labels)}
+    # repositories share a few label variants so generating them does not dominate
+    variants = [generate_labels(labels, variant) for variant in range(min(repos, 10))]
+
+    operations = 0
+    start = time.perf_counter()
+    for i in range(repos):
+        operations += len(label_operations(variants[i % len(variants)], new_labels, mode))
+    elapsed = time.perf_counter() - start
+
+    click.echo('{} labels x {} repos ({}): {:.3f} s, {:.1f} repos/s, {} operation(s)'.format(
+        labels, repos, mode, elapsed, repos / elapsed, operations))
+
+
+if __name__ == '__main__':
+    bench_diff()
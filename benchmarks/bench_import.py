@@ -0,0 +1,70 @@
+import os
+import statistics
+import subprocess
+import sys
+import click
+
+
+LABELORD = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'labelord.py')
+PATHS = {
+    'version': ['--version'],
+    'help': ['--help'],
+    'run-help': ['run', '--help'],
+}
+# modules which should be imported only by commands that use them
+HEAVY_MODULES = ('requests', 'urllib3', 'asyncio', 'sqlite3', 'configparser', 'concurrent.futures', 'flask',
+                 'hashlib', 'urllib.parse', 'json')
+
+
+def import_times(args):
+    # imports of one interpreter run as {module: cumulative microseconds} and their total,
+    # only top level imports are summed up (they include their own imports)
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative)
+        if not name[1:].startswith(' '):
+            total = total + int(cumulative)
+    return modules, total
+
+
+def is_heavy(module):
+    return any(module == heavy or module.startswith(heavy + '.') for heavy in HEAVY_MODULES)
+
+
+@click.command()
+@click.option('-n', '--repeat', default=10, type=click.IntRange(1, None),
+              help='Runs of each path (median is reported).')
+@click.option('--budget', default=None, type=float,
+              help='Fail when imports of a path take longer than interpreter with click plus this many ms.')
+def bench_import(repeat, budget):
+    """Measure import time of labelord --version and --help paths (python -X importtime)."""
+    # interpreter itself with click is the floor of any labelord invocation,
+    # modules imported already by click are not labelord's doing
+    click_runs = [import_times(['-c', 'import click']) for _ in range(repeat)]
+    click_total = statistics.median(total for _, total in click_runs) / 1000
+    click_modules = set(click_runs[0][0])
+    click.echo('{:<10} {:8.1f} ms'.format('click', click_total))
+
+    failed = False
+    for name, args in sorted(PATHS.items()):
+        runs = [import_times([LABELORD] + args) for _ in range(repeat)]
+        total = statistics.median(total for _, total in runs) / 1000
+        heavy = sorted(module for module in runs[0][0] if is_heavy(module) and module not in click_modules)
+        click.echo('{:<10} {:8.1f} ms, {:+.1f} ms over click{}'.format(
+            name, total, total - click_total, ', imports ' + ', '.join(heavy) if heavy else ''))
+        if heavy or (budget is not None and total - click_total > budget):
+            failed = True
+
+    if failed:
+        click.echo('Import budget exceeded')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    bench_import()
@@ -0,0 +1,280 @@
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import click
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures'))
+
+from utils import make_labels, make_repos
+
+
+ENDPOINTS = ('all', 'repos', 'labels', 'label', 'create', 'update', 'delete')
+SERVER_ERRORS = (500, 502, 503, 504)
+ABUSE_MESSAGE = b'{"message": "You have triggered an abuse detection mechanism. Please wait a few minutes."}'
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # client gone before slow response (timeout) is not an error of the server
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def parse_latency(specs):
+    # ENDPOINT=DISTRIBUTION pairs (or just DISTRIBUTION for all endpoints) to samplers, distributions are
+    # SECONDS, uniform:LOW:HIGH, exp:MEAN and normal:MEAN:DEVIATION
+    latency = {}
+    for spec in specs:
+        endpoint, _, distribution = spec.rpartition('=')
+        endpoint = endpoint or 'all'
+        if endpoint not in ENDPOINTS:
+            raise click.BadParameter('unknown endpoint {} (use one of {})'.format(endpoint, ', '.join(ENDPOINTS)))
+        latency[endpoint] = parse_distribution(distribution)
+    return latency
+
+
+def parse_distribution(distribution):
+    name, *params = distribution.split(':')
+    try:
+        if not params:
+            seconds = float(name)
+            return lambda rnd: seconds
+        params = [float(param) for param in params]
+        if name == 'uniform' and len(params) == 2:
+            return lambda rnd: rnd.uniform(*params)
+        if name == 'exp' and len(params) == 1:
+            return lambda rnd: rnd.expovariate(1 / params[0])
+        if name == 'normal' and len(params) == 2:
+            return lambda rnd: max(0.0, rnd.gauss(*params))
+    except ValueError:
+        pass
+    raise click.BadParameter('unknown latency distribution {}'.format(distribution))
+
+
+class FakeGitHub:
+    # GitHub API stand-in serving N repos with the same M labels,
+    # changes of labels are accepted but not stored so runs can be repeated
+
+    def __init__(self, repos, labels, page_size=100, latency=None, error_rate=0.0, abuse_rate=0.0,
+                 abuse_retry_after=1, rate_limit=None, rate_window=3600, api_url=None, port=0):
+        self.page_size = page_size
+        self.latency = latency or {}
+        self.error_rate = error_rate
+        self.abuse_rate = abuse_rate
+        self.abuse_retry_after = abuse_retry_after
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.repos = make_repos(0, repos)
+        self.repo_names = set(repo['full_name'] for repo in self.repos)
+        self.labels = make_labels(0, labels)
+        self.label_names = {label['name'].lower(): label for label in self.labels}
+        self.lock = threading.Lock()
+        self.counts = {}
+        # remaining requests and reset time for each token
+        self.limits = {}
+        self.random = random.Random(0)
+
+        self.server = ThreadingServer(('127.0.0.1', port), self.handler())
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        # links in responses point to this URL
+        self.api_url = api_url or self.url
+        self.repos_pages = self.pages(self.repos)
+        self.labels_pages = self.pages(self.labels)
+
+    def pages(self, items):
+        pages = []
+        for start in range(0, max(len(items), 1), self.page_size):
+            pages.append(json.dumps(items[start:start + self.page_size]).encode('utf-8'))
+        return pages
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requests(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def delay(self, endpoint):
+        sampler = self.latency.get(endpoint, self.latency.get('all'))
+        if sampler is None:
+            return 0.0
+        with self.lock:
+            return sampler(self.random)
+
+    def happens(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def server_error(self):
+        with self.lock:
+            return self.random.choice(SERVER_ERRORS)
+
+    def rate_limit_headers(self, token):
+        # headers of rate limit and whether the request fits in it
+        if self.rate_limit is None:
+            return {}, True
+        with self.lock:
+            now = time.time()
+            remaining, reset = self.limits.get(token, (self.rate_limit, now + self.rate_window))
+            if now >= reset:
+                remaining, reset = self.rate_limit, now + self.rate_window
+            allowed = remaining > 0
+            if allowed:
+                remaining = remaining - 1
+            self.limits[token] = (remaining, reset)
+        headers = {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(math.ceil(reset)),
+        }
+        return headers, allowed
+
+    def handler(self):
+        github = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, do not wait for ACK between them
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_api('GET')
+
+            def do_POST(self):
+                self.handle_api('POST')
+
+            def do_PATCH(self):
+                self.handle_api('PATCH')
+
+            def do_DELETE(self):
+                self.handle_api('DELETE')
+
+            def handle_api(self, method):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                url = urlsplit(self.path)
+                query = dict(parse_qsl(url.query))
+                parts = url.path.strip('/').split('/')
+                endpoint = self.endpoint(method, parts)
+                github.count(endpoint)
+
+                delay = github.delay(endpoint)
+                if delay:
+                    time.sleep(delay)
+                self.extra_headers, allowed = github.rate_limit_headers(self.headers.get('Authorization', ''))
+                if not allowed:
+                    return self.respond(403, b'{"message": "API rate limit exceeded"}')
+                if github.happens(github.abuse_rate):
+                    return self.respond(403, ABUSE_MESSAGE, {'Retry-After': str(github.abuse_retry_after)})
+                if github.happens(github.error_rate):
+                    return self.respond(github.server_error(), b'{"message": "Server Error"}')
+
+                if endpoint == 'repos':
+                    return self.respond_page(github.repos_pages, url.path, query)
+                if endpoint is None or '/'.join(parts[1:3]) not in github.repo_names:
+                    return self.respond(404, b'{"message": "Not Found"}')
+                if endpoint == 'labels':
+                    return self.respond_page(github.labels_pages, url.path, query)
+                if endpoint == 'create':
+                    return self.respond(201, body)
+                label = github.label_names.get(parts[4].lower())
+                if label is None:
+                    return self.respond(404, b'{"message": "Not Found"}')
+                if endpoint == 'label':
+                    return self.respond(200, json.dumps(label).encode('utf-8'))
+                if endpoint == 'update':
+                    return self.respond(200, body)
+                return self.respond(204, b'')
+
+            def endpoint(self, method, parts):
+                if method == 'GET' and parts == ['user', 'repos']:
+                    return 'repos'
+                if len(parts) < 4 or parts[0] != 'repos' or parts[3] != 'labels':
+                    return None
+                if len(parts) == 4:
+                    return {'GET': 'labels', 'POST': 'create'}.get(method)
+                if len(parts) == 5:
+                    return {'GET': 'label', 'PATCH': 'update', 'DELETE': 'delete'}.get(method)
+                return None
+
+            def respond_page(self, pages, path, query):
+                page = int(query.get('page', 1))
+                if page > len(pages):
+                    return self.respond(200, b'[]')
+                link = []
+                page_url = github.api_url + path + '?per_page={}&page={}'
+                if page < len(pages):
+                    link.append('<{}>; rel="next"'.format(page_url.format(github.page_size, page + 1)))
+                    link.append('<{}>; rel="last"'.format(page_url.format(github.page_size, len(pages))))
+                self.respond(200, pages[page - 1], {'Link': ', '.join(link)} if link else {})
+
+            def respond(self, status, body, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in dict(self.extra_headers, **(headers or {})).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def latency_option(function):
+    option = click.option('-l', '--latency', multiple=True, callback=lambda ctx, param, value: parse_latency(value),
+                          help='Latency as [ENDPOINT=]DISTRIBUTION, endpoints are {}, distributions are SECONDS, '
+                               'uniform:LOW:HIGH, exp:MEAN and normal:MEAN:DEVIATION.'.format(', '.join(ENDPOINTS)))
+    return option(function)
+
+
+@click.command()
+@click.option('-p', '--port', default=8000, type=click.IntRange(0, 65535), help='Port to listen on.')
+@click.option('-n', '--repos', default=100, type=click.IntRange(1, None), help='Number of repositories.')
+@click.option('-m', '--labels', default=100, type=click.IntRange(1, None), help='Number of labels in repository.')
+@click.option('--page-size', default=100, type=click.IntRange(1, None), help='Items per page of listings.')
+@latency_option
+@click.option('--error-rate', default=0.0, type=float, help='Fraction of requests failed with 5xx.')
+@click.option('--abuse-rate', default=0.0, type=float, help='Fraction of requests refused by abuse detection.')
+@click.option('--abuse-retry-after', default=1, type=click.IntRange(0, None),
+              help='Retry-After of abuse detection responses in seconds.')
+@click.option('--rate-limit', default=None, type=click.IntRange(0, None), help='Requests allowed per token and window.')
+@click.option('--rate-window', default=3600, type=click.IntRange(1, None), help='Rate limit window in seconds.')
+def serve(port, repos, labels, page_size, latency, error_rate, abuse_rate, abuse_retry_after, rate_limit, rate_window):
+    """Serve fake GitHub API (use labelord --api-url to connect)."""
+    github = FakeGitHub(repos, labels, page_size, latency, error_rate, abuse_rate, abuse_retry_after,
+                        rate_limit, rate_window, port=port)
+    click.echo('Serving fake GitHub API at {}'.format(github.url))
+    try:
+        github.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        github.server.server_close()
+        click.echo('Served {}'.format(', '.join('{} {}'.format(count, endpoint)
+                                                for endpoint, count in sorted(github.counts.items(), key=str))))
+
+
+if __name__ == '__main__':
+    serve()
@@ -2,146 +2,413 @@
 # MI-PYT, task 1 (requests+click)
 # File: labelord.py
 # TODO: create requirements.txt and install
+# modules not needed by every command (requests, asyncio, sqlite3, configparser, hashlib, ...)
+# are imported by functions which use them, --version and --help do not pay for importing them
 import click
-import requests
-import configparser
-import json
-
+import math
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+
+API_URL = 'https://api.github.com'
+# maximal number of pages downloaded at once (and held in memory)
+PAGE_WORKERS = 8
+# default number of requests in flight with asyncio backend (one event loop instead of threads)
+ASYNC_JOBS = 50
+# number of repositories which labels are read by one GraphQL query
+GRAPHQL_BATCH = 50
+# requests are paced to fit the rate limit when fewer of them remain
+RATE_LIMIT_PACING = 100
+# how many times is request refused due to rate limit repeated
+RATE_LIMIT_RETRIES = 3
+# rate limits of REST and GraphQL API are counted separately (X-RateLimit-Resource)
+RATE_LIMIT_RESOURCES = ('core', 'graphql')
+# seconds to wait for secondary rate limit when Retry-After cannot be read
+RETRY_AFTER_DEFAULT = 60
+# responses and errors (names of requests exceptions) which are worth to repeat request
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+RETRY_ERRORS = ('ConnectionError', 'Timeout')
+# upper bound of one backoff in seconds
+RETRY_MAX_DELAY = 60
+# default size limit of cached responses in MB
+CACHE_SIZE = 50
+# default seconds for which the inventory of all repositories is used without asking GitHub
+INVENTORY_TTL = 3600
+# endpoint classes of requests statistics in order of printing
+STATS_ENDPOINTS = ('repos', 'labels', 'label', 'graphql', 'ADD', 'UPD', 'DEL')
+STATS_PERCENTILES = (50, 95, 99)
+# upper bounds of request latency histogram in metrics file
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# size of output written at once with --output jsonl
+OUTPUT_BUFFER_SIZE = 64 * 1024
+# default timeout of one HTTP request in seconds
+REQUEST_TIMEOUT = 30
+# default seconds between runs of watch and how often is its config file checked for changes
+WATCH_INTERVAL = 300
+CONFIG_POLL_INTERVAL = 1
+# default seconds for which events of one repository are collected before it is reconciled
+WEBHOOK_DELAY = 5
+# queue entry of reading the template repository again (no repository name starts with colon)
+TEMPLATE_REFRESH = ':template'
+# default age in seconds after which a snapshot used by offline dry run is reported as stale
+SNAPSHOT_MAX_AGE = 24 * 3600
 
 # PRIVATE FUNCTIONS
 
+# output of repositories processed by workers is buffered there
+_output = threading.local()
+# set while the command prints JSON records
+_jsonl_errors = threading.Event()
+
+
+def echo(message):
+    buffer = getattr(_output, 'buffer', None)
+    if buffer is not None:
+        buffer.append(message)
+        return
+    writer = getattr(_output, 'writer', None)
+    if writer is None:
+        click.echo(message)
+    else:
+        writer.write(message)
+
+
+def emit(record):
+    # one JSON record per line with --output jsonl
+    import json
+    echo(json.dumps(record, separators=(',', ':')))
+
+
+def is_jsonl(configuration):
+    return configuration.get('output') == 'jsonl'
+
+
+class BufferedWriter:
+    # lines are written to stream in large chunks instead of one write per line
+
+    def __init__(self, stream, size=OUTPUT_BUFFER_SIZE):
+        self.stream = stream
+        self.size = size
+        self.lines = []
+        self.length = 0
+
+    def write(self, line):
+        self.lines.append(line)
+        self.length = self.length + len(line) + 1
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.stream.write("\n".join(self.lines) + "\n")
+            self.stream.flush()
+        self.lines = []
+        self.length = 0
+
+
+def use_buffered_output(ctx):
+    # output of main thread (where all output is printed) is written by buffered writer
+    # until the command ends
+    _output.writer = BufferedWriter(click.get_text_stream('stdout'))
+
+    def close():
+        flush_output()
+        _output.writer = None
+    ctx.call_on_close(close)
+
+
+def use_jsonl_errors(ctx):
+    # errors which end the command are JSON records too (in all threads) until the command ends
+    _jsonl_errors.set()
+    ctx.call_on_close(_jsonl_errors.clear)
+
+
+def report_error(message, code, record=None):
+    # message of error which ends the command, record (or just message) with --output jsonl
+    if _jsonl_errors.is_set():
+        emit(dict({"type": "error", "message": message, "exit": code}, **(record or {})))
+    elif message is not None:
+        echo(message)
+    exit(code)
+
+
+def flush_output():
+    writer = getattr(_output, 'writer', None)
+    if writer is not None:
+        writer.flush()
+
+
+def buffered(function, *args):
+    # run function and collect its output instead of printing
+    previous = getattr(_output, 'buffer', None)
+    _output.buffer = []
+    try:
+        return function(*args), _output.buffer
+    finally:
+        _output.buffer = previous
+
+
+def process_repos(repos, jobs, function, *args):
+    return sum(map_repos(repos, jobs, function, *args))
+
+
+def map_repos(repos, jobs, function, *args):
+    if jobs <= 1:
+        for repo in repos:
+            yield function(repo, *args)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(buffered, function, repo, *args) for repo in repos]
+        # print output of repositories in the same order as serial run would
+        for future in futures:
+            result, lines = future.result()
+            for line in lines:
+                echo(line)
+            yield result
+
 
 def request(url, session):
-    r = session.get(url)
-    if r.status_code == 404:
-        click.echo("GitHub: ERROR 404 - Not Found")
-        exit(5)
+    return list(request_items(url, session))
 
-    if r.status_code == 401:
-        click.echo('GitHub: ERROR 401 - Bad credentials')
-        exit(4)
 
-    if r.status_code != 200:
-        exit(10)
+def request_items(url, session):
+    r = cached_get(session, url)
+    check_response(r)
+    return response_items(r, session)
+
 
-    result = r.json()
-    if r.links:
+def response_items(r, session):
+    # items are yielded as soon as their page arrives
+    for page in iterate_pages(r, session):
+        yield from page
+
+
+def iterate_pages(r, session):
+    # first page has been already downloaded and checked
+    yield r.json()
+    urls = remaining_page_urls(r.links)
+    if urls:
+        # pages are known from the first one, download them at once
+        yield from prefetch_pages(urls, session)
+    elif r.links:
         while 'next' in r.links:
             next_url = r.links['next']['url']
-            r = session.get(next_url)
-            result = result + r.json()
+            r = cached_get(session, next_url)
+            yield r.json()
+
+
+def prefetch_pages(urls, session):
+    from concurrent.futures import ThreadPoolExecutor
+    urls = deque(urls)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+        # keep at most PAGE_WORKERS pages downloading ahead of consumer
+        while urls or pending:
+            while urls and len(pending) < PAGE_WORKERS:
+                pending.append(executor.submit(cached_get, session, urls.popleft()))
+            page = pending.popleft().result()
+            yield page.json()
+
+
+def remaining_page_urls(links):
+    # urls of all next pages, links header has to contain both next and last
+    if 'next' not in links or 'last' not in links:
+        return []
+
+    first = page_number(links['next']['url'])
+    last = page_number(links['last']['url'])
+    if first is None or last is None:
+        return []
+
+    from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+    parts = urlsplit(links['last']['url'])
+    query = parse_qsl(parts.query)
+    urls = []
+    for page in range(first, last + 1):
+        page_query = [(key, str(page) if key == 'page' else value) for key, value in query]
+        urls.append(urlunsplit(parts._replace(query=urlencode(page_query))))
+    return urls
+
+
+def page_number(url):
+    from urllib.parse import parse_qsl, urlsplit
+    page = dict(parse_qsl(urlsplit(url).query)).get('page')
+    if page is None or not page.isdigit():
+        return None
+    return int(page)
+
+
+def check_response(r):
+    if r.status_code == 404:
+        report_error("GitHub: ERROR 404 - Not Found", 5, {"status": 404})
 
-    return result
+    if r.status_code == 401:
+        report_error("GitHub: ERROR 401 - Bad credentials", 4, {"status": 401})
+
+    if r.status_code != 200:
+        # only JSON record describes other errors
+        report_error(None, 10, {"status": r.status_code, "message": response_message(r)})
 
 
 def labels_for_run(session, repo_name, configuration):
+    # first response of labels listing (0 if labels cannot be read)
+    r = cached_get(session, labels_url(session.api_url, repo_name))
+    if not check_labels_response(r, repo_name, configuration):
+        return 0
+    return r
+
+
+def check_labels_response(r, repo_name, configuration):
+    return check_labels_status(r.status_code, repo_name, configuration, response_message(r))
+
+
+def response_message(r):
+    # GitHub explains errors in JSON body, error pages of proxies (5xx) are not JSON
+    try:
+        return r.json()['message']
+    except (ValueError, KeyError, TypeError):
+        return getattr(r, 'reason', None) or 'Error'
+
+
+def check_labels_status(status_code, repo_name, configuration, message=None):
+    # any listing but 200 means that labels of repository cannot be read
+    if status_code == 200:
+        return True
     is_quiet = configuration['quiet']
     is_verbose = configuration['verbose']
-    r = session.get('https://api.github.com/repos/' + repo_name + '/labels?per_page=100&page=1')
-    if r.status_code == 404:
-        if (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
-            click.echo("ERROR: LBL; {}; 404 - Not Found".format(repo_name))
-            return 0
+    if status_code == 404:
+        message = "Not Found"
+    elif status_code == 401:
+        message = "Bad credentials"
+    elif message is None:
+        message = "Error"
+
+    if is_jsonl(configuration):
+        emit({"type": "operation", "method": "LBL", "repo": repo_name, "result": "ERR",
+              "status": status_code, "message": message})
+        return False
 
+    if status_code == 401:
         if not is_quiet:
-            click.echo("[LBL][ERR] {}; 404 - Not Found".format(repo_name))
-        return 0
+            echo("[LBL][ERR] {}; 401 - Bad credentials".format(repo_name))
+        return False
 
-    if r.status_code == 401:
-        if not is_quiet:
-            click.echo("[LBL][ERR] {}; 401 - Bad credentials".format(repo_name))
-        return 0
+    if (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+        echo("ERROR: LBL; {}; {} - {}".format(repo_name, status_code, message))
+        return False
 
-    result = r.json()
-    return result
+    if not is_quiet:
+        echo("[LBL][ERR] {}; {} - {}".format(repo_name, status_code, message))
+    return False
 
 
-def print_repos(session):
-    json_data = get_all_repos(session)
+def print_repos(json_data):
     for one_repo in json_data:
         click.echo("{}".format(one_repo["full_name"]))
-    exit(0)
 
 
-def print_labels(session, name_repo):
-    json_data = get_all_labels(session, name_repo)
+def print_labels(json_data):
     for one_repo in json_data:
         click.echo("#{} {}".format(one_repo['color'], one_repo['name']))
-    exit(0)
 
 
 def get_all_labels(session, name_repo):
-    json_data = request('https://api.github.com/repos/' + name_repo + '/labels?per_page=100&page=1', session)
+    json_data = request(labels_url(session.api_url, name_repo), session)
     return json_data
 
 
-def get_all_repos(session):
-    json_data = request('https://api.github.com/user/repos?per_page=100&page=1', session)
-    return json_data
+def repos_url(api_url):
+    return api_url + '/user/repos?per_page=100&page=1'
 
 
-def diff(first, second):
-    second = set(second)
-    return [item for item in first if item not in second]
+def graphql_url(api_url):
+    # GitHub Enterprise serves REST API at /api/v3 and GraphQL API at /api/graphql
+    if api_url.endswith('/api/v3'):
+        return api_url[:-len('/v3')] + '/graphql'
+    return api_url + '/graphql'
 
 
-def analyze_labels_with_new(session, repo_name, old_git, new_labels, configuration, mode):
-    parsed_git_labels = parse_labels(old_git)
-    lowercase_git_labels = [x.lower() for x in parsed_git_labels]
-    all_git_labels_name = [x for x in parsed_git_labels]
-    lowercase_config_labels = [x.lower() for x in new_labels]
+def labels_url(api_url, name_repo):
+    return api_url + '/repos/' + name_repo + '/labels?per_page=100&page=1'
 
+
+def label_url(api_url, name_repo, label_name=None):
+    # URL of labels collection or of one label
+    url = api_url + '/repos/' + name_repo + '/labels'
+    if label_name is None:
+        return url
+    return url + '/' + label_name
+
+
+def inventory_record(repo):
+    # just the attributes used to select repositories, listing has ~80 more of them
+    permissions = repo.get('permissions') or {}
+    return {'full_name': repo['full_name'], 'archived': repo.get('archived', False), 'fork': repo.get('fork', False),
+            'permissions': {key: permissions[key] for key in ('admin', 'push', 'pull') if key in permissions}}
+
+
+def apply_operations(session, repo_name, operations, configuration):
     number_errors = 0
+    for operation in operations:
+        # if return value is false, increase errors
+        if not request_run(configuration, session, repo_name, *operation):
+            number_errors = number_errors + 1
+
+    return number_errors
+
+
+def label_operations(old_git, new_labels, mode):
+    # operations are tuples (method, old_name, new_label_name, new_color)
+    parsed_git_labels = parse_labels(old_git)
+    if new_labels is None:
+        # remove all labels
+        return [("DEL", label_name, "", "") for label_name in parsed_git_labels]
+
+    # labels are compared case insensitive, first git label with the same lowercase name is used
+    git_labels_index = {}
+    for label_name in parsed_git_labels:
+        git_labels_index.setdefault(label_name.lower(), label_name)
+
+    operations = []
     if mode == "replace":
         # remove all different labels
-        labels_for_delete = diff(lowercase_git_labels, lowercase_config_labels)
-        for label in labels_for_delete:
-            index = lowercase_git_labels.index(label)
-            label_name = all_git_labels_name[index]
-            # if return value is false, increase errors
-            if not delete_label(session, repo_name, label_name, parsed_git_labels[label_name], configuration):
-                number_errors = number_errors + 1
+        lowercase_config_labels = set(x.lower() for x in new_labels)
+        for label_name in parsed_git_labels:
+            label_name_lower = label_name.lower()
+            if label_name_lower not in lowercase_config_labels:
+                label_git_name = git_labels_index[label_name_lower]
+                operations.append(("DEL", label_git_name, "", parsed_git_labels[label_git_name]))
 
     for key in new_labels:
         new_label_name = key
-        label_config_name_lower = key.lower()
         label_config_color = new_labels[new_label_name]
         # for each new label analyze if exist
-        if label_config_name_lower in lowercase_git_labels:
+        label_git_name = git_labels_index.get(key.lower())
+        if label_git_name is not None:
             # compare git label with new label (update or create)
-            errors = compare_git_with_new_label(all_git_labels_name, parsed_git_labels, lowercase_git_labels,
-                                               label_config_name_lower, label_config_color, new_label_name,
-                                               repo_name, session, configuration)
-            # increase errors if was
-            number_errors = number_errors + errors
+            operations.extend(compare_git_with_new_label(label_git_name, parsed_git_labels,
+                                                         label_config_color, new_label_name))
         else:
             # create new label because not exist
-            # if return value is false, increase errors
-            if not create_label(session, repo_name, new_label_name, label_config_color, configuration):
-                number_errors = number_errors + 1
+            operations.append(("ADD", "", new_label_name, label_config_color))
 
-    return number_errors
+    return operations
 
 
-def compare_git_with_new_label(all_git_labels_name, parsed_git_labels, lowercase_git_labels, label_config_name_lower,
-                               label_config_color, new_label_name, repo_name, session, configuration):
-    number_errors = 0
-    index = lowercase_git_labels.index(label_config_name_lower)
-    label_git_name = all_git_labels_name[index]
+def compare_git_with_new_label(label_git_name, parsed_git_labels, label_config_color, new_label_name):
     if new_label_name in parsed_git_labels:
         # update label because color has been changed
         if label_config_color != parsed_git_labels[new_label_name]:
-            # if return value is false, increase errors
-            if not update_label(session, repo_name, new_label_name, label_git_name, label_config_color, configuration):
-                number_errors = 1
-    else:
-        # update label because name has been changed
-        # if return value is false, increase errors
-        if not update_label(session, repo_name, new_label_name, label_git_name,
-                            label_config_color, configuration):
-            number_errors = 1
+            return [("UPD", label_git_name, new_label_name, label_config_color)]
+        return []
 
-    return number_errors
+    # update label because name has been changed
+    return [("UPD", label_git_name, new_label_name, label_config_color)]
 
 
 def parse_labels(labels):
@@ -159,19 +426,8 @@ def parse_repos(repos):
     return parsed_repos
 
 
-def update_label(session, repo_name, label_name, old_label_name, new_color, configuration):
-    return request_run(configuration, session, repo_name, "UPD", old_label_name, label_name, new_color)
-
-
-def create_label(session, repo_name, label_name, new_color, configuration):
-    return request_run(configuration, session, repo_name, "ADD", "", label_name, new_color)
-
-
-def delete_label(session, repo_name, label_name, color, configuration):
-    return request_run(configuration, session, repo_name, "DEL", label_name, "", color)
-
-
 def request_run(configuration, session, repo_name, method, old_name, new_label_name, new_color):
+    import json
     is_dry = configuration['dry_run']
     is_quiet = configuration['quiet']
     is_verbose = configuration['verbose']
@@ -179,41 +435,57 @@ def request_run(configuration, session, repo_name, method, old_name, new_label_n
     if not is_dry:
         if method == "ADD":
             header_data = {"name": new_label_name, "color": new_color}
-            url = 'https://api.github.com/repos/' + repo_name + '/labels'
-            response = session.post(url, json.dumps(header_data))
+            url = label_url(session.api_url, repo_name)
+            recheck = partial(recheck_label, session, repo_name, new_label_name, new_color, 201)
+            response = api_request(session, 'post', url, recheck, data=json.dumps(header_data))
             return handle_response(response, configuration, "ADD", 201, repo_name, new_label_name, new_color)
         if method == "DEL":
-            url = 'https://api.github.com/repos/' + repo_name + '/labels/' + old_name
-            response = session.delete(url)
+            url = label_url(session.api_url, repo_name, old_name)
+            recheck = partial(recheck_label, session, repo_name, old_name, None, 204)
+            response = api_request(session, 'delete', url, recheck)
             return handle_response(response, configuration, "DEL", 204, repo_name, old_name, new_color)
         if method == "UPD":
             header_data = {"name": new_label_name, "color": new_color}
-            url = 'https://api.github.com/repos/' + repo_name + '/labels/' + old_name
-            response = session.patch(url, json.dumps(header_data))
+            url = label_url(session.api_url, repo_name, old_name)
+            recheck = partial(recheck_label, session, repo_name, new_label_name, new_color, 200)
+            response = api_request(session, 'patch', url, recheck, data=json.dumps(header_data))
             return handle_response(response, configuration, "UPD", 200, repo_name, new_label_name, new_color)
     else:
-        if not is_quiet and is_verbose:
+        count_outcome(configuration, method, "DRY")
+        if is_jsonl(configuration):
+            label_name = old_name if method == "DEL" else new_label_name
+            emit({"type": "operation", "method": method, "repo": repo_name, "label": label_name,
+                  "color": new_color, "result": "DRY"})
+        elif not is_quiet and is_verbose:
             if method == "DEL":
-                click.echo("[{}][DRY] {}; {}; {}".format(method, repo_name, old_name, new_color))
+                echo("[{}][DRY] {}; {}; {}".format(method, repo_name, old_name, new_color))
             else:
-                click.echo("[{}][DRY] {}; {}; {}".format(method, repo_name, new_label_name, new_color))
+                echo("[{}][DRY] {}; {}; {}".format(method, repo_name, new_label_name, new_color))
         return True
 
 
 def handle_response(response, configuration, method, valid_code, repo_name, label_name, color):
     is_verbose = configuration['verbose']
     is_quiet = configuration['quiet']
+    record = {"type": "operation", "method": method, "repo": repo_name, "label": label_name, "color": color}
     if response.status_code == valid_code:
-        if not is_quiet and is_verbose:
-            click.echo("[{}][SUC] {}; {}; {}".format(method, repo_name, label_name, color))
+        count_outcome(configuration, method, "SUC")
+        if is_jsonl(configuration):
+            emit(dict(record, result="SUC"))
+        elif not is_quiet and is_verbose:
+            echo("[{}][SUC] {}; {}; {}".format(method, repo_name, label_name, color))
         return True
     else:
-        if not is_quiet and is_verbose:
-            click.echo("[{}][ERR] {}; {}; {}; {} - {}".format(method, repo_name, label_name, color,
-                                                              response.status_code, response.json()['message']))
-        if (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
-            click.echo("ERROR: {}; {}; {}; {}; {} - {}".format(method, repo_name, label_name, color,
-                                                               response.status_code, response.json()['message']))
+        count_outcome(configuration, method, "ERR")
+        message = response_message(response)
+        if is_jsonl(configuration):
+            emit(dict(record, result="ERR", status=response.status_code, message=message))
+        elif not is_quiet and is_verbose:
+            echo("[{}][ERR] {}; {}; {}; {} - {}".format(method, repo_name, label_name, color,
+                                                        response.status_code, message))
+        elif (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+            echo("ERROR: {}; {}; {}; {}; {} - {}".format(method, repo_name, label_name, color,
+                                                         response.status_code, message))
 
         return False
 
@@ -225,70 +497,154 @@ def print_version(ctx, param, value):
     ctx.exit()
 
 
-def prepare_session(ctx):
+def prepare_session(ctx, jobs=1, offline=False):
+    # offline session (dry run from snapshot) sends no requests, so it needs
+    # no token, cache of responses nor prewarmed connections
     token = ctx.obj['token']
     config = ctx.obj['config']
-    if not token:
+    if not token and not offline:
         config_name = config
+        import configparser
         configparser.optionxform = str
         config_file = configparser.ConfigParser()
         if not config_file.read(config_name):
-            click.echo("No GitHub token has been provided")
-            exit(3)
+            report_error("No GitHub token has been provided", 3)
 
         token = config_file['github']['token']
 
-    session = ctx.obj.get('session', requests.Session())
-    session.headers = {'User-Agent': 'Python'}
-
-    def token_auth(req):
-        req.headers['Authorization'] = 'token ' + token
-        return req
-
-    session.auth = token_auth
+    tokens = parse_tokens(token or '')
+    if not tokens and not offline:
+        report_error("No GitHub token has been provided", 3)
+
+    # asyncio backend uses just the first token
+    ctx.obj['token'] = tokens[0] if tokens else None
+    session = ctx.obj.get('session')
+    if session is None:
+        # each worker can download PAGE_WORKERS pages at once
+        session = pooled_session(ctx.obj['pool_size'] or jobs * PAGE_WORKERS)
+    session.headers.update({'User-Agent': 'Python'})
+    session.timeout = ctx.obj['timeout']
+    session.auth = token_auth(tokens[0]) if tokens else None
+    session.api_url = ctx.obj['api_url'].rstrip('/')
+    session.token_pool = TokenPool(tokens)
+    session.retry_policy = RetryPolicy(ctx.obj['retries'], ctx.obj['retry_backoff'])
+    session.stats = None
+    session.cache = None
+    session.inventory_ttl = ctx.obj['inventory_ttl']
+    if not ctx.obj['no_cache'] and not offline:
+        session.cache = ResponseCache(os.path.join(ctx.obj['cache_dir'], 'responses.sqlite'),
+                                      ctx.obj['cache_size'] * 1024 * 1024)
     ctx.obj['session'] = session
     ctx.obj['config_file'] = config
+    if ctx.obj['prewarm'] and not offline:
+        prewarm_connections(session, jobs)
     return ctx
 
 
 def setup_config(config):
+    import configparser
     config_file = configparser.ConfigParser()
     config_file.optionxform = str
 
     if not config_file.read(config):
-        exit(3)
+        report_error(None, 3, {"message": "Config file {} cannot be read".format(config)})
 
     if 'repos' not in config_file:
         # if not is_quiet:
-        click.echo("No repositories specification has been found")
-        exit(7)
+        report_error("No repositories specification has been found", 7)
 
     if not config_file['repos']:
-        click.echo("SUMMARY: 0 repo(s) updated successfully")
+        if _jsonl_errors.is_set():
+            emit({"type": "summary", "result": "SUC", "repos": 0, "errors": 0, "skipped": 0, "retried": 0})
+        else:
+            echo("SUMMARY: 0 repo(s) updated successfully")
         exit(0)
 
     if 'labels' not in config_file:
         # if not is_quiet:
-        click.echo("No labels specification has been found")
-        exit(6)
+        report_error("No labels specification has been found", 6)
 
     return config_file
 
 
 def run_response(configuration, len_repos, all_errors):
+    report_run(configuration, len_repos, all_errors)
+    if all_errors > 0:
+        exit(10)
+    else:
+        exit(0)
+
+
+def report_run(configuration, len_repos, all_errors):
+    is_quiet = configuration['quiet']
+    is_verbose = configuration['verbose']
+    skipped = len(configuration.get('skipped', []))
+    retried = configuration.get('retried', 0)
+    counts = []
+    if skipped > 0:
+        counts.append("{} touched, {} skipped as unchanged".format(len_repos - skipped, skipped))
+    if retried > 0:
+        counts.append("{} request(s) retried".format(retried))
+    counts = " ({})".format(", ".join(counts)) if counts else ""
+    if is_jsonl(configuration):
+        emit({"type": "summary", "result": "ERR" if all_errors > 0 else "SUC", "repos": len_repos,
+              "errors": all_errors, "skipped": skipped, "retried": retried})
+    elif not is_quiet and is_verbose:
+        if all_errors > 0:
+            click.echo("[SUMMARY] {} error(s) in total, please check log above{}".format(all_errors, counts))
+        else:
+            click.echo("[SUMMARY] {} repo(s) updated successfully{}".format(len_repos, counts))
+
+    elif (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+        if all_errors > 0:
+            click.echo("SUMMARY: {} error(s) in total, please check log above{}".format(all_errors, counts))
+        else:
+            click.echo("SUMMARY: {} repo(s) updated successfully{}".format(len_repos, counts))
+
+    stats = configuration.get('request_stats')
+    if stats is not None and configuration.get('stats'):
+        print_stats(configuration, stats)
+    if configuration.get('metrics_file'):
+        write_metrics(configuration['metrics_file'], configuration, len_repos, all_errors)
+
+
+def print_stats(configuration, stats):
     is_quiet = configuration['quiet']
     is_verbose = configuration['verbose']
+    connections, requests_count = configuration.get('connections', (0, 0))
+    if is_jsonl(configuration):
+        for record in stats.records():
+            emit(dict({"type": "stats"}, **record))
+        if requests_count > 0:
+            emit({"type": "stats", "connections": connections, "pooled_requests": requests_count})
+        return
+
+    lines = stats.report()
+    if requests_count > 0:
+        lines.append("{} connection(s) opened for {} request(s), {:.1f}% reused".format(
+            connections, requests_count, 100 * (requests_count - connections) / requests_count))
+    for line in lines:
+        if not is_quiet and is_verbose:
+            click.echo("[STATS] {}".format(line))
+        if (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+            click.echo("STATS: {}".format(line))
+
+
+def plan_response(configuration, planned, all_errors):
+    is_quiet = configuration['quiet']
+    is_verbose = configuration['verbose']
+    operations = sum(len(repo_operations) for _, repo_operations in planned)
     if not is_quiet and is_verbose:
         if all_errors > 0:
             click.echo("[SUMMARY] {} error(s) in total, please check log above".format(all_errors))
         else:
-            click.echo("[SUMMARY] {} repo(s) updated successfully".format(len_repos))
+            click.echo("[SUMMARY] {} operation(s) planned for {} repo(s)".format(operations, len(planned)))
 
     if (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
         if all_errors > 0:
             click.echo("SUMMARY: {} error(s) in total, please check log above".format(all_errors))
         else:
-            click.echo("SUMMARY: {} repo(s) updated successfully".format(len_repos))
+            click.echo("SUMMARY: {} operation(s) planned for {} repo(s)".format(operations, len(planned)))
 
     if all_errors > 0:
         exit(10)
@@ -296,32 +652,1382 @@ def run_response(configuration, len_repos, all_errors):
         exit(0)
 
 
+def snapshot_response(configuration, len_repos, all_errors):
+    is_quiet = configuration['quiet']
+    is_verbose = configuration['verbose']
+    if not is_quiet and is_verbose:
+        if all_errors > 0:
+            click.echo("[SUMMARY] {} error(s) in total, please check log above".format(all_errors))
+        else:
+            click.echo("[SUMMARY] labels of {} repo(s) captured".format(len_repos))
+
+    if (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+        if all_errors > 0:
+            click.echo("SUMMARY: {} error(s) in total, please check log above".format(all_errors))
+        else:
+            click.echo("SUMMARY: labels of {} repo(s) captured".format(len_repos))
+
+    if all_errors > 0:
+        exit(10)
+    else:
+        exit(0)
+
+
+def sync_all(session, config_file, configuration, mode):
+    # one run over all repositories, returns number of repositories and errors
+    if configuration['stats'] or configuration['metrics_file']:
+        session.stats = RequestStats()
+        configuration['request_stats'] = session.stats
+    retried = session.retry_policy.count
+    repos = get_repos(config_file, configuration, session)
+    new_labels = get_new_labels(config_file, configuration, session, mode)
+    repo_labels = read_repos_labels(repos, session, new_labels, configuration, mode)
+    # analyze each repo in github
+    all_errors = process_repos(repos, configuration['jobs'], sync_repo, session, repo_labels,
+                               new_labels, configuration, mode)
+
+    configuration['retried'] = session.retry_policy.count - retried
+    configuration['rate_limit_remaining'] = session.token_pool.remaining()
+    configuration['connections'] = connection_stats(session)
+    return len(repos), all_errors
+
+
+def file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def wait_for_change(path, mtime, interval):
+    # sleep for interval, wake up sooner when the file is changed
+    deadline = time.time() + interval
+    while time.time() < deadline and file_mtime(path) == mtime:
+        time.sleep(min(CONFIG_POLL_INTERVAL, max(0, deadline - time.time())))
+
+
+def error_message(error):
+    if isinstance(error, SystemExit):
+        return "exited with code {}".format(error.code)
+    return "{}: {}".format(type(error).__name__, error)
+
+
+def report_failed_run(configuration, error):
+    message = error_message(error)
+    if is_jsonl(configuration):
+        emit({"type": "summary", "result": "ERR", "message": message})
+    elif not configuration['quiet']:
+        echo("Run failed ({}), watching continues".format(message))
+
+
+def reload_config(config, config_file, configuration):
+    # broken config file does not stop watching, the previous one is used
+    import configparser
+    try:
+        new_config_file = setup_config(config)
+    except (SystemExit, configparser.Error):
+        if is_jsonl(configuration):
+            emit({"type": "config", "path": config, "result": "ERR"})
+        elif not configuration['quiet']:
+            echo("Config file {} cannot be used, keeping the previous one".format(config))
+        return config_file
+
+    if is_jsonl(configuration):
+        emit({"type": "config", "path": config, "result": "SUC"})
+    elif not configuration['quiet'] and configuration['verbose']:
+        echo("[CONFIG] {} reloaded".format(config))
+    return new_config_file
+
+
 def get_repos(config_file, configuration, session):
+    repos = get_config_repos(config_file)
+    snapshot = configuration.get('snapshot')
+    if configuration['all_repos'] and snapshot is not None:
+        return list(snapshot['repos'])
+    if configuration['all_repos']:
+        repos = repo_inventory(session)
+        repos = parse_repos(repos)
+
+    return repos
+
+
+def get_config_repos(config_file):
     repos = []
     config_repos = config_file['repos']
     for key in config_repos:
         if config_file['repos'].getboolean(key):
             repos.append(key)
+    return repos
 
-    if configuration['all_repos']:
-        repos = get_all_repos(session)
-        repos = parse_repos(repos)
 
-    return repos
+def get_template_repo(config_file, configuration):
+    # check if exist template repo
+    if configuration['template_repo']:
+        return configuration['template_repo']
+    if "others" in config_file:
+        return config_file['others']['template-repo']
+    return None
 
 
 def new_labels_from_template(name, session):
-    all_labels_template = get_all_labels(session, name)
-    return parse_labels(all_labels_template)
+    # snapshot of template labels is used as long as GitHub confirms all its pages by ETag
+    import json
+    cache = getattr(session, 'cache', None)
+    if cache is None:
+        all_labels_template = get_all_labels(session, name)
+        return parse_labels(all_labels_template)
+
+    snapshot = cache.get_template(name)
+    known = {}
+    if snapshot is not None:
+        unchanged, known = validate_template(session, json.loads(snapshot[0]))
+        if unchanged:
+            return dict(json.loads(snapshot[1]))
+
+    new_labels, pages = fetch_template(session, name, known)
+    if pages is not None:
+        cache.set_template(name, json.dumps(pages), json.dumps(list(new_labels.items())))
+    return new_labels
+
+
+def validate_template(session, pages):
+    # all pages are validated at once, not one after another, returns whether none
+    # has changed and {url: response} of pages which do not have to be downloaded again
+    def validate(page):
+        url, etag = page
+        r = api_request(session, 'get', url, headers={'If-None-Match': etag})
+        if r.status_code != 304:
+            store_response(session.cache, url, r)
+            return r, r
+        # unchanged page is read from response cache if it keeps the same version
+        entry = session.cache.get(url)
+        if entry is not None and entry[0] == etag:
+            return r, cached_response(r, entry)
+        return r, None
+
+    results = map_pages(validate, pages)
+    known = {url: response for (url, _), (_, response) in zip(pages, results) if response is not None}
+    return all(r.status_code == 304 for r, _ in results), known
+
+
+def fetch_template(session, name, known=None):
+    # labels of template repository and [url, ETag] of its pages (None if they cannot be validated later),
+    # known responses (from validation of snapshot) are not requested again
+    known = known or {}
+
+    def get(page_url):
+        r = known.get(page_url)
+        return cached_get(session, page_url) if r is None else r
+
+    url = labels_url(session.api_url, name)
+    r = get(url)
+    check_response(r)
+    urls = remaining_page_urls(r.links)
+    if r.links and not urls:
+        return parse_labels(response_items(r, session)), None
+
+    responses = [r] + map_pages(get, urls)
+    for response in responses:
+        check_response(response)
+    pages = [[page_url, response.headers.get('ETag')] for page_url, response in zip([url] + urls, responses)]
+    new_labels = parse_labels(item for response in responses for item in response.json())
+    if any(etag is None for _, etag in pages):
+        return new_labels, None
+    return new_labels, pages
+
+
+def map_pages(function, pages):
+    # pages are requested in parallel, results keep their order
+    if len(pages) <= 1:
+        return [function(page) for page in pages]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(len(pages), PAGE_WORKERS)) as executor:
+        return list(executor.map(function, pages))
+
+
+def get_new_labels(config_file, configuration, session, mode):
+    # None means that all labels should be removed
+    new_labels = config_file['labels']
+    name = get_template_repo(config_file, configuration)
+    if name and configuration.get('snapshot') is not None:
+        new_labels = snapshot_template_labels(configuration['snapshot'], name)
+    elif name:
+        new_labels = new_labels_from_template(name, session)
+
+    if mode == "replace" and not config_file['labels']:
+        # remove all labels if is mode replace and labels in config file is empty
+        return None
+    return new_labels
+
+
+def read_repos_labels(repos, session, new_labels, configuration, mode):
+    # labels of all repos read in batches or None when each repo is read separately
+    configuration['fingerprint'] = labels_fingerprint(new_labels, mode)
+    configuration['skipped'] = []
+    snapshot = configuration.get('snapshot')
+    if snapshot is not None:
+        # repository missing in snapshot is reported as not found
+        return {repo_name: snapshot['repos'].get(repo_name) for repo_name in repos}
+    if configuration['graphql']:
+        return graphql_labels(session, repos)
+    return None
+
+
+def repo_operations(repo_name, session, repo_labels, new_labels, configuration, mode):
+    # operations for repository, None if its labels cannot be read
+    if repo_labels is not None:
+        # labels of repository have been already read by GraphQL
+        all_repo_labels = repo_labels[repo_name]
+        if all_repo_labels is None:
+            check_labels_status(404, repo_name, configuration)
+            return None
+        return label_operations(all_repo_labels, new_labels, mode)
+
+    r = labels_for_run(session, repo_name, configuration)
+    if r == 0:
+        return None
+
+    fingerprint = configuration['fingerprint']
+    if is_repo_in_sync(session, repo_name, r, fingerprint):
+        configuration['skipped'].append(repo_name)
+        return []
+
+    # labels are parsed page by page as they arrive
+    operations = label_operations(response_items(r, session), new_labels, mode)
+    if not operations:
+        remember_repo_in_sync(session, repo_name, r, fingerprint)
+    return operations
+
+
+def sync_repo(repo_name, session, repo_labels, new_labels, configuration, mode):
+    operations = repo_operations(repo_name, session, repo_labels, new_labels, configuration, mode)
+    if operations is None:
+        return 1
+
+    # analyze each label in repository
+    number_errors = apply_operations(session, repo_name, operations, configuration)
+    if new_labels is None:
+        # errors of removing all labels are not counted
+        return 0
+    return number_errors
+
+
+def plan_repo(repo_name, session, repo_labels, new_labels, configuration, mode):
+    operations = repo_operations(repo_name, session, repo_labels, new_labels, configuration, mode)
+    if operations is not None:
+        # print planned operations as dry run does
+        apply_operations(session, repo_name, operations, dict(configuration, dry_run=True))
+    return operations
+
+
+def snapshot_repo(repo_name, session, configuration):
+    # current labels of repository, None if they cannot be read
+    r = labels_for_run(session, repo_name, configuration)
+    if r == 0:
+        return None
+    return [{'name': label['name'], 'color': label['color']} for label in response_items(r, session)]
 
 
-def remove_labels_from_all_repos(session, configuration, repos):
-    for repo in repos:
-        repo_name = repo
-        all_repo_labels = labels_for_run(session, repo_name, configuration)
-        parsed_labels = parse_labels(all_repo_labels)
-        for key in parsed_labels:
-            delete_label(session, repo_name, key, "", configuration)
+def snapshot_template_labels(snapshot, name):
+    labels = snapshot.get('templates', {}).get(name)
+    if labels is None:
+        report_error("Template repository {} is not in snapshot".format(name), 5)
+    return parse_labels(labels)
+
+
+def load_snapshot(configuration):
+    import json
+    try:
+        snapshot = json.load(configuration['snapshot'])
+    except ValueError:
+        raise click.BadParameter("snapshot is not valid JSON", param_hint='--snapshot')
+    created = snapshot.get('created') if isinstance(snapshot, dict) else None
+    if not isinstance(created, (int, float)) or not isinstance(snapshot.get('repos'), dict):
+        raise click.BadParameter("snapshot has not been written by snapshot command", param_hint='--snapshot')
+    report_snapshot_age(configuration, time.time() - snapshot['created'])
+    return snapshot
+
+
+def report_snapshot_age(configuration, age):
+    is_quiet = configuration['quiet']
+    is_verbose = configuration['verbose']
+    stale = age > configuration['snapshot_max_age']
+    if is_jsonl(configuration):
+        emit({"type": "snapshot", "age": int(age), "stale": stale})
+        return
+    message = "labels read from snapshot taken {} ago{}".format(format_age(age), ", it is STALE" if stale else "")
+    if not is_quiet and is_verbose:
+        echo("[SNAPSHOT] {}".format(message))
+    elif (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+        echo("SNAPSHOT: {}".format(message))
+
+
+def format_age(seconds):
+    minutes = int(max(0, seconds) // 60)
+    if minutes < 120:
+        return "{} minute(s)".format(minutes)
+    if minutes < 48 * 60:
+        return "{} hour(s)".format(minutes // 60)
+    return "{} day(s)".format(minutes // (24 * 60))
+
+
+def load_plan(plan):
+    import json
+    # operations of repositories [[repo, [[method, old_name, new_label_name, new_color], ...]], ...]
+    try:
+        content = json.load(plan)
+    except ValueError:
+        raise click.BadParameter("plan is not valid JSON", param_hint='PLAN')
+    planned = content.get('repos') if isinstance(content, dict) else None
+    if not isinstance(planned, list) or not all(is_planned_repo(item) for item in planned):
+        raise click.BadParameter("plan has not been written by plan command", param_hint='PLAN')
+    return planned, content.get('remove_all') is True
+
+
+def is_planned_repo(item):
+    if not isinstance(item, list) or len(item) != 2 or not isinstance(item[0], str) or not isinstance(item[1], list):
+        return False
+    return all(isinstance(operation, list) and len(operation) == 4 and operation[0] in ("ADD", "UPD", "DEL") and
+               all(isinstance(value, str) for value in operation) for operation in item[1])
+
+
+def apply_planned(item, session, configuration):
+    repo_name, operation = item
+    return request_run(configuration, session, repo_name, *operation)
+
+
+def graphql_labels(session, repos):
+    import json
+    # labels of repositories as {repo: [labels]}, None for unreadable repository
+    repo_labels = {}
+    queue = deque()
+    for repo_name in repos:
+        if '/' in repo_name:
+            repo_labels[repo_name] = []
+            queue.append((repo_name, None))
+        else:
+            repo_labels[repo_name] = None
+
+    while queue:
+        batch = [queue.popleft() for _ in range(min(GRAPHQL_BATCH, len(queue)))]
+        # query only reads, so it can be always repeated
+        r = api_request(session, 'post', graphql_url(session.api_url), lambda: None,
+                        data=json.dumps({"query": graphql_query(batch)}))
+        check_response(r)
+        data, alias_errors = graphql_data(r.json())
+        for index, (repo_name, _) in enumerate(batch):
+            repository = data.get('r{}'.format(index))
+            if repository is None:
+                # only missing repository is reported as 404 - Not Found, other errors end the command
+                error = alias_errors.get('r{}'.format(index), {})
+                if error.get('type') != 'NOT_FOUND':
+                    report_graphql_error(error, [error])
+                repo_labels[repo_name] = None
+                continue
+            labels = repository['labels']
+            repo_labels[repo_name].extend(labels['nodes'])
+            # only repositories with more labels are asked again
+            if labels['pageInfo']['hasNextPage']:
+                queue.append((repo_name, labels['pageInfo']['endCursor']))
+
+    return repo_labels
+
+
+def graphql_data(body):
+    # data of query and errors by alias, failure of the whole query (rate limit,
+    # too many nodes, bad query) comes with 200 as well and ends the command
+    errors = body.get('errors') or []
+    data = body.get('data')
+    if data is None:
+        report_graphql_error((errors or [{}])[0], errors)
+    alias_errors = {}
+    for error in errors:
+        if error.get('path'):
+            alias_errors.setdefault(error['path'][0], error)
+    return data, alias_errors
+
+
+def report_graphql_error(error, errors):
+    report_error("GitHub: ERROR {} - {}".format(error.get('type', 'GraphQL'), error.get('message', 'No data')),
+                 10, {"errors": errors})
+
+
+def graphql_query(batch):
+    import json
+    fields = []
+    for index, (repo_name, cursor) in enumerate(batch):
+        owner, name = repo_name.split('/', 1)
+        after = ', after: {}'.format(json.dumps(cursor)) if cursor else ''
+        fields.append('r{}: repository(owner: {}, name: {}) {{ labels(first: 100{}) {{ nodes {{ name color }} '
+                      'pageInfo {{ hasNextPage endCursor }} }} }}'.format(index, json.dumps(owner),
+                                                                          json.dumps(name), after))
+    return 'query { ' + ' '.join(fields) + ' }'
+
+
+def labels_fingerprint(new_labels, mode):
+    # removing all labels is the same as replacing them with none
+    import hashlib
+    import json
+    data = json.dumps([mode, sorted(dict(new_labels or {}).items())])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def is_repo_in_sync(session, repo_name, r, fingerprint):
+    # repo was in sync with the same labels and its listing has not changed since
+    cache = getattr(session, 'cache', None)
+    if cache is None or 'next' in r.links or 'ETag' not in r.headers:
+        return False
+    return cache.get_repo_state(repo_name) == (fingerprint, r.headers['ETag'])
+
+
+def remember_repo_in_sync(session, repo_name, r, fingerprint):
+    cache = getattr(session, 'cache', None)
+    if cache is not None and 'ETag' in r.headers:
+        cache.set_repo_state(repo_name, fingerprint, r.headers['ETag'])
+
+# RATE LIMIT AND RETRIES
+
+
+class BufferedResponse:
+    # response read to memory which can be handled as requests one
+
+    def __init__(self, status_code, text, links, reason=None):
+        self.status_code = status_code
+        self.text = text
+        self.links = links
+        self.reason = reason
+
+    def json(self):
+        import json
+        return json.loads(self.text)
+
+
+class RateLimiter:
+    # budget of requests of one resource shared by all workers, read from X-RateLimit-* headers
+
+    def __init__(self, resource='core'):
+        self.lock = threading.Lock()
+        self.resource = resource
+        self.remaining = None
+        self.reset = None
+        self.next_time = 0
+        # token refused due to rate limit is not used until then
+        self.blocked_until = 0
+
+    def delay(self):
+        # seconds to wait before the next request
+        with self.lock:
+            now = time.time()
+            if self.blocked_until > now:
+                return self.blocked_until - now
+            if self.remaining is None or self.reset is None or self.reset <= now:
+                return 0
+            if self.remaining <= 0:
+                # wait for the next window
+                return self.reset - now
+            if self.remaining > RATE_LIMIT_PACING:
+                return 0
+
+            # spread the rest of budget evenly until reset
+            start = max(now, self.next_time)
+            self.next_time = start + (self.reset - now) / self.remaining
+            self.remaining = self.remaining - 1
+            return start - now
+
+    def budget(self):
+        # known remaining requests of the current window
+        with self.lock:
+            if self.blocked_until > time.time():
+                return 0
+            if self.remaining is None or self.reset is None or self.reset <= time.time():
+                return float('inf')
+            return self.remaining
+
+    def update(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        if response.headers.get('X-RateLimit-Resource', self.resource) != self.resource:
+            # budget of another resource
+            return
+        with self.lock:
+            if self.reset == int(reset):
+                # responses of workers may come in different order
+                self.remaining = min(self.remaining, int(remaining))
+            else:
+                self.reset = int(reset)
+                self.remaining = int(remaining)
+
+    def block(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def retry_delay(self, response):
+        # seconds to wait before repeating request refused due to rate limit, None otherwise
+        if response.status_code not in (403, 429):
+            return None
+        if 'Retry-After' in response.headers:
+            # secondary (abuse) rate limit
+            return parse_retry_after(response.headers['Retry-After'])
+        if response.headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in response.headers:
+            return max(0, int(response.headers['X-RateLimit-Reset']) - time.time())
+        return None
+
+
+def parse_retry_after(value):
+    # seconds or HTTP date (RFC 7231)
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return RETRY_AFTER_DEFAULT
+
+
+def api_request(session, method, url, recheck=None, **kwargs):
+    # all GitHub API calls of requests backend go through there,
+    # changes are repeated only with recheck that returns response
+    # when the failed attempt has been applied anyway
+    import requests
+    retry_errors = tuple(getattr(requests, name) for name in RETRY_ERRORS)
+    retry_policy = getattr(session, 'retry_policy', None)
+    attempt = 0
+    while True:
+        try:
+            r = limited_request(session, method, url, **kwargs)
+            if r.status_code not in RETRY_STATUS_CODES:
+                return r
+        except retry_errors:
+            if retry_policy is None or not retry_policy.can_retry(method, recheck, attempt):
+                raise
+        else:
+            if retry_policy is None or not retry_policy.can_retry(method, recheck, attempt):
+                return r
+
+        retry_policy.wait(attempt)
+        attempt = attempt + 1
+        if recheck is not None:
+            applied = recheck()
+            if applied is not None:
+                return applied
+
+
+def recheck_label(session, repo_name, label_name, color, valid_code):
+    # response with valid code if the label is already in desired state,
+    # color None means that the label should not exist
+    url = label_url(session.api_url, repo_name, label_name)
+    r = api_request(session, 'get', url)
+    if color is None:
+        return BufferedResponse(valid_code, '', {}) if r.status_code == 404 else None
+    if r.status_code != 200:
+        return None
+    # GitHub finds label case insensitive and keeps colors lowercase
+    label = r.json()
+    if label['name'] == label_name and label['color'].lower() == color.lower():
+        return BufferedResponse(valid_code, '', {})
+    return None
+
+
+def limited_request(session, method, url, **kwargs):
+    token_pool = getattr(session, 'token_pool', None)
+    if token_pool is None:
+        return timed_request(session, method, url, **kwargs)
+
+    resource = 'graphql' if url == graphql_url(session.api_url) else 'core'
+    attempt = 0
+    while True:
+        token, rate_limiter = token_pool.choose(resource)
+        delay = rate_limiter.delay()
+        if delay > 0:
+            time.sleep(delay)
+        r = timed_request(session, method, url, auth=token_auth(token), **kwargs)
+        rate_limiter.update(r)
+        if r.status_code == 401 and token_pool.discard(token):
+            # repeat with another token
+            continue
+
+        delay = rate_limiter.retry_delay(r)
+        if delay is None or attempt == RATE_LIMIT_RETRIES:
+            return r
+        attempt = attempt + 1
+        # limit applies to account of the token, another token with budget is used
+        # right away, otherwise the request waits for this one
+        rate_limiter.block(delay)
+
+
+def token_auth(token):
+    def auth(req):
+        req.headers['Authorization'] = 'token ' + token
+        return req
+    return auth
+
+
+class TokenPool:
+    # tokens with their own rate limits, requests use the least exhausted one
+
+    def __init__(self, tokens):
+        import hashlib
+        self.lock = threading.Lock()
+        self.rate_limiters = [(token, {resource: RateLimiter(resource) for resource in RATE_LIMIT_RESOURCES})
+                              for token in tokens]
+        # identifies tokens (and so their repositories) in local cache without storing them
+        self.fingerprint = hashlib.sha1(' '.join(tokens).encode('utf-8')).hexdigest()
+
+    def choose(self, resource='core'):
+        # token with the most requests of resource left and its rate limiter
+        with self.lock:
+            token, rate_limiters = max(self.rate_limiters, key=lambda item: item[1][resource].budget())
+            return token, rate_limiters[resource]
+
+    def remaining(self):
+        # REST API requests left for all tokens, None until GitHub tells
+        with self.lock:
+            known = [rate_limiters['core'].remaining for _, rate_limiters in self.rate_limiters
+                     if rate_limiters['core'].remaining is not None]
+        return sum(known) if known else None
+
+    def discard(self, token):
+        # bad credentials, the last token is kept to report the error
+        with self.lock:
+            if len(self.rate_limiters) == 1:
+                return False
+            self.rate_limiters = [item for item in self.rate_limiters if item[0] != token]
+            return True
+
+
+def parse_tokens(value):
+    # several tokens can be separated by commas or whitespaces
+    return value.replace(',', ' ').split()
+
+
+class RetryPolicy:
+    # repeating of requests failed due to transient errors
+
+    def __init__(self, retries, backoff):
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def can_retry(self, method, recheck, attempt):
+        return attempt < self.retries and (method == 'get' or recheck is not None)
+
+    def wait(self, attempt):
+        with self.lock:
+            self.count = self.count + 1
+        # exponential backoff with full jitter
+        import random
+        time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, self.backoff * 2 ** attempt)))
+
+# REQUESTS STATISTICS
+
+
+def timed_request(session, method, url, **kwargs):
+    kwargs.setdefault('timeout', getattr(session, 'timeout', None))
+    stats = getattr(session, 'stats', None)
+    if stats is None:
+        return getattr(session, method)(url, **kwargs)
+
+    start = time.perf_counter()
+    r = getattr(session, method)(url, **kwargs)
+    latency = time.perf_counter() - start
+    size = len(r.content) + len(kwargs.get('data') or '')
+    stats.record(endpoint_class(session.api_url, method, url), latency, size)
+    return r
+
+
+def endpoint_class(api_url, method, url):
+    from urllib.parse import urlsplit
+    if url == graphql_url(api_url):
+        return 'graphql'
+    path = urlsplit(url).path[len(urlsplit(api_url).path):]
+    parts = path.strip('/').split('/')
+    if parts == ['user', 'repos']:
+        return 'repos'
+    if len(parts) == 4:
+        return {'get': 'labels', 'post': 'ADD'}.get(method, method)
+    return {'get': 'label', 'patch': 'UPD', 'delete': 'DEL'}.get(method, method)
+
+
+class RequestStats:
+    # latencies and transferred bytes of HTTP calls by endpoint class
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.latencies = {}
+        self.sizes = {}
+
+    def record(self, endpoint, latency, size):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            self.sizes[endpoint] = self.sizes.get(endpoint, 0) + size
+
+    def records(self):
+        # statistics of each endpoint class and the total one (without endpoint)
+        elapsed = time.perf_counter() - self.start
+        records = []
+        with self.lock:
+            endpoints = sorted(self.latencies, key=lambda e: (STATS_ENDPOINTS + (e,)).index(e))
+            for endpoint in endpoints:
+                latencies = sorted(self.latencies[endpoint])
+                record = {"endpoint": endpoint, "requests": len(latencies), "bytes": self.sizes[endpoint]}
+                for p in STATS_PERCENTILES:
+                    record["p{}".format(p)] = round(percentile(latencies, p), 6)
+                records.append(record)
+            requests_count = sum(len(latencies) for latencies in self.latencies.values())
+            operations = sum(len(self.latencies.get(endpoint, [])) for endpoint in ('ADD', 'UPD', 'DEL'))
+        records.append({"requests": requests_count, "operations": operations, "seconds": round(elapsed, 6),
+                        "requests_per_second": round(requests_count / elapsed, 3),
+                        "ops_per_second": round(operations / elapsed, 3)})
+        return records
+
+    def report(self):
+        lines = []
+        *endpoints, total = self.records()
+        for record in endpoints:
+            percentiles = ", ".join("p{} {:.3f} s".format(p, record["p{}".format(p)]) for p in STATS_PERCENTILES)
+            lines.append("{}: {} request(s), {} B, {}".format(record["endpoint"], record["requests"],
+                                                              record["bytes"], percentiles))
+        lines.append("{} request(s), {} operation(s) in {:.3f} s, {:.1f} requests/s, {:.1f} ops/s".format(
+            total["requests"], total["operations"], total["seconds"], total["requests_per_second"],
+            total["ops_per_second"]))
+        return lines
+
+
+def percentile(values, p):
+    # nearest rank of sorted values
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+# METRICS EXPORT
+
+
+# outcomes of operations are counted by workers
+_outcomes_lock = threading.Lock()
+
+
+def count_outcome(configuration, method, outcome):
+    outcomes = configuration.get('outcomes')
+    if outcomes is None:
+        return
+    with _outcomes_lock:
+        outcomes[(method, outcome)] = outcomes.get((method, outcome), 0) + 1
+
+
+def write_metrics(path, configuration, len_repos, all_errors):
+    # OpenMetrics text file for node exporter textfile collector,
+    # written to temporary file first so the collector never reads half of it
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, metric_type))
+        for suffix, labels, value in samples:
+            labels = ",".join('{}="{}"'.format(key, label_value) for key, label_value in labels)
+            lines.append("{}{}{} {}".format(name, suffix, "{" + labels + "}" if labels else "", value))
+
+    skipped = len(configuration.get('skipped', []))
+    metric("labelord_repos_processed", "gauge", "Repositories processed by the last run.", [("", [], len_repos)])
+    metric("labelord_repos_skipped", "gauge", "Repositories skipped as unchanged by the last run.", [("", [], skipped)])
+    metric("labelord_errors", "gauge", "Errors of the last run.", [("", [], all_errors)])
+    outcomes = configuration.get('outcomes', {})
+    metric("labelord_operations", "gauge", "Label operations of the last run by method and result.",
+           [("", [("method", method), ("result", outcome)], outcomes.get((method, outcome), 0))
+            for method in ("ADD", "UPD", "DEL") for outcome in ("SUC", "ERR", "DRY")])
+
+    stats = configuration.get('request_stats')
+    if stats is not None:
+        samples = []
+        with stats.lock:
+            latencies = {endpoint: list(values) for endpoint, values in stats.latencies.items()}
+        for endpoint in sorted(latencies):
+            values = latencies[endpoint]
+            endpoint_label = ("endpoint", endpoint)
+            for bucket in METRICS_BUCKETS:
+                samples.append(("_bucket", [endpoint_label, ("le", bucket)], sum(1 for v in values if v <= bucket)))
+            samples.append(("_bucket", [endpoint_label, ("le", "+Inf")], len(values)))
+            samples.append(("_sum", [endpoint_label], round(sum(values), 6)))
+            samples.append(("_count", [endpoint_label], len(values)))
+        metric("labelord_http_request_duration_seconds", "histogram",
+               "Latency of GitHub API requests of the last run.", samples)
+
+    remaining = configuration.get('rate_limit_remaining')
+    if remaining is not None:
+        metric("labelord_rate_limit_remaining", "gauge", "GitHub API requests left for all tokens.",
+               [("", [], remaining)])
+    duration = time.time() - configuration['started']
+    metric("labelord_run_duration_seconds", "gauge", "Duration of the last run.", [("", [], round(duration, 3))])
+    metric("labelord_last_run_timestamp_seconds", "gauge", "Time when the last run finished.",
+           [("", [], int(time.time()))])
+    lines.append("# EOF")
+
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temporary, path)
+
+# CONNECTION POOL
+
+
+def pooled_session(pool_size):
+    import requests
+    session = requests.Session()
+    # connections to GitHub are kept alive and reused by all workers,
+    # pool has to be large enough for all of them or connections are discarded
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def prewarm_connections(session, connections):
+    # open connections before workers need them, rate limit endpoint does not count to rate limit
+    from concurrent.futures import ThreadPoolExecutor
+    url = session.api_url + '/rate_limit'
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        list(executor.map(lambda _: prewarm_connection(session, url), range(connections)))
+
+
+def prewarm_connection(session, url):
+    import requests
+    try:
+        # body is read so the connection is returned to pool
+        session.get(url, timeout=session.timeout).content
+    except requests.RequestException:
+        pass
+
+
+def connection_stats(session):
+    # connections opened and requests sent through them by pools of session
+    connections = 0
+    requests_count = 0
+    for adapter in set(session.adapters.values()):
+        poolmanager = getattr(adapter, 'poolmanager', None)
+        if poolmanager is None:
+            continue
+        for key in poolmanager.pools.keys():
+            pool = poolmanager.pools.get(key)
+            if pool is not None:
+                connections = connections + pool.num_connections
+                requests_count = requests_count + pool.num_requests
+    return connections, requests_count
+
+# RESPONSE CACHE
+
+
+class ResponseCache:
+    # bodies of GET responses stored with their ETag, least recently used are evicted
+
+    def __init__(self, path, max_size):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # connection is shared by workers, access is serialized by lock
+        import sqlite3
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            # cache from older version without sizes is just dropped
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(responses)')]
+            if columns and 'size' not in columns:
+                self.connection.execute('DROP TABLE responses')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                                    '(url TEXT PRIMARY KEY, etag TEXT, link TEXT, body BLOB, used REAL, size INTEGER)')
+            # covering index, neither sum of sizes nor eviction order have to read bodies
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used, size)')
+            # repositories found in sync with labels (fingerprint) at listing ETag
+            self.connection.execute('CREATE TABLE IF NOT EXISTS repos '
+                                    '(repo TEXT PRIMARY KEY, fingerprint TEXT, etag TEXT)')
+            # labels of template repositories with [url, ETag] of pages they have been read from
+            self.connection.execute('CREATE TABLE IF NOT EXISTS templates '
+                                    '(repo TEXT PRIMARY KEY, pages TEXT, labels TEXT)')
+            # all repositories available to tokens (--all-repos) with just the attributes labelord uses
+            self.connection.execute('CREATE TABLE IF NOT EXISTS inventory '
+                                    '(key TEXT PRIMARY KEY, repos TEXT, fetched REAL)')
+
+    def get(self, url):
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT etag, link, body FROM responses WHERE url = ?',
+                                          (url,)).fetchone()
+            if row is not None:
+                self.connection.execute('UPDATE responses SET used = ? WHERE url = ?', (time.time(), url))
+        return row
+
+    def set(self, url, etag, link, body):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                    (url, etag, link, body, time.time(), len(body)))
+            self.evict()
+
+    def get_repo_state(self, repo_name):
+        with self.lock:
+            return self.connection.execute('SELECT fingerprint, etag FROM repos WHERE repo = ?',
+                                           (repo_name,)).fetchone()
+
+    def set_repo_state(self, repo_name, fingerprint, etag):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO repos VALUES (?, ?, ?)', (repo_name, fingerprint, etag))
+
+    def get_template(self, repo_name):
+        with self.lock:
+            return self.connection.execute('SELECT pages, labels FROM templates WHERE repo = ?',
+                                           (repo_name,)).fetchone()
+
+    def set_template(self, repo_name, pages, labels):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO templates VALUES (?, ?, ?)', (repo_name, pages, labels))
+
+    def get_inventory(self, key):
+        with self.lock:
+            return self.connection.execute('SELECT repos, fetched FROM inventory WHERE key = ?', (key,)).fetchone()
+
+    def set_inventory(self, key, repos):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO inventory VALUES (?, ?, ?)', (key, repos, time.time()))
+
+    def evict(self):
+        # nothing is read unless the limit is exceeded, then least recently used go first
+        size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if size <= self.max_size:
+            return
+        evicted = []
+        for url, length in self.connection.execute('SELECT url, size FROM responses ORDER BY used'):
+            if size <= self.max_size:
+                break
+            evicted.append((url,))
+            size = size - length
+        self.connection.executemany('DELETE FROM responses WHERE url = ?', evicted)
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'labelord')
+
+
+def cached_get(session, url):
+    cache = getattr(session, 'cache', None)
+    if cache is None:
+        return api_request(session, 'get', url)
+
+    entry = cache.get(url)
+    if entry is None:
+        r = api_request(session, 'get', url)
+    else:
+        r = api_request(session, 'get', url, headers={'If-None-Match': entry[0]})
+
+    if r.status_code == 304 and entry is not None:
+        # not modified (and not counted to rate limit), use cached body
+        return cached_response(r, entry)
+
+    store_response(cache, url, r)
+    return r
+
+
+def cached_response(r, entry):
+    # response 200 with body from cache for 304 - Not Modified
+    import requests
+    etag, link, body = entry
+    cached = requests.Response()
+    cached.status_code = 200
+    cached.headers = requests.structures.CaseInsensitiveDict(r.headers)
+    if link:
+        cached.headers['Link'] = link
+    cached.url = r.url
+    cached.request = r.request
+    cached.encoding = 'utf-8'
+    cached._content = body
+    return cached
+
+
+def store_response(cache, url, r):
+    if r.status_code == 200 and 'ETag' in r.headers:
+        cache.set(url, r.headers['ETag'], r.headers.get('Link'), r.content)
+
+
+def repo_inventory(session):
+    # repositories for --all-repos, listing is downloaded (with conditional requests)
+    # just when the stored inventory is older than TTL
+    import json
+    cache = getattr(session, 'cache', None)
+    if cache is None:
+        return [inventory_record(repo) for repo in request_items(repos_url(session.api_url), session)]
+
+    key = '{} {}'.format(repos_url(session.api_url), session.token_pool.fingerprint)
+    entry = cache.get_inventory(key)
+    if entry is not None and time.time() - entry[1] < session.inventory_ttl:
+        return json.loads(entry[0])
+
+    repos = [inventory_record(repo) for repo in request_items(repos_url(session.api_url), session)]
+    cache.set_inventory(key, json.dumps(repos, separators=(',', ':')))
+    return repos
+
+# ASYNCIO BACKEND
+
+
+def check_backend(ctx, param, value):
+    if value == 'asyncio':
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            raise click.BadParameter("asyncio backend requires aiohttp package to be installed")
+    return value
+
+
+def run_async(coroutine):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def async_client(token, timeout):
+    import aiohttp
+    headers = {'User-Agent': 'Python', 'Authorization': 'token ' + token}
+    return aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+async def async_call(client, semaphore, method, url, data=None):
+    async with semaphore:
+        async with client.request(method, url, data=data) as r:
+            text = await r.text()
+            links = {str(rel): {'url': str(link['url'])} for rel, link in r.links.items()}
+            return BufferedResponse(r.status, text, links, r.reason)
+
+
+async def async_request(url, client, semaphore):
+    r = await async_call(client, semaphore, 'GET', url)
+    check_response(r)
+    return await async_response_items(r, client, semaphore)
+
+
+async def async_response_items(r, client, semaphore):
+    result = []
+    async for page in async_iterate_pages(r, client, semaphore):
+        result.extend(page)
+    return result
+
+
+async def async_iterate_pages(r, client, semaphore):
+    import asyncio
+    # first page has been already downloaded and checked
+    yield r.json()
+    urls = deque(remaining_page_urls(r.links))
+    if urls:
+        pending = deque()
+        try:
+            # keep at most PAGE_WORKERS pages downloading ahead of consumer
+            while urls or pending:
+                while urls and len(pending) < PAGE_WORKERS:
+                    pending.append(asyncio.ensure_future(async_call(client, semaphore, 'GET', urls.popleft())))
+                page = await pending.popleft()
+                yield page.json()
+        finally:
+            for task in pending:
+                task.cancel()
+        return
+
+    while 'next' in r.links:
+        r = await async_call(client, semaphore, 'GET', r.links['next']['url'])
+        yield r.json()
+
+
+async def async_print_all(token, timeout, url, print_function):
+    import asyncio
+    semaphore = asyncio.Semaphore(PAGE_WORKERS)
+    async with async_client(token, timeout) as client:
+        r = await async_call(client, semaphore, 'GET', url)
+        check_response(r)
+        async for page in async_iterate_pages(r, client, semaphore):
+            print_function(page)
+
+
+async def async_request_run(configuration, client, semaphore, repo_name, method, old_name, new_label_name, new_color):
+    import json
+    # returns result of handle_response with its output
+    if configuration['dry_run']:
+        return buffered(request_run, configuration, None, repo_name, method, old_name, new_label_name, new_color)
+
+    api_url = configuration['api_url']
+    header_data = json.dumps({"name": new_label_name, "color": new_color})
+    if method == "ADD":
+        url = label_url(api_url, repo_name)
+        response = await async_call(client, semaphore, 'POST', url, header_data)
+        return buffered(handle_response, response, configuration, "ADD", 201, repo_name, new_label_name, new_color)
+    if method == "DEL":
+        url = label_url(api_url, repo_name, old_name)
+        response = await async_call(client, semaphore, 'DELETE', url)
+        return buffered(handle_response, response, configuration, "DEL", 204, repo_name, old_name, new_color)
+    if method == "UPD":
+        url = label_url(api_url, repo_name, old_name)
+        response = await async_call(client, semaphore, 'PATCH', url, header_data)
+        return buffered(handle_response, response, configuration, "UPD", 200, repo_name, new_label_name, new_color)
+
+
+async def async_sync_repo(repo_name, client, semaphore, new_labels, configuration, mode):
+    import asyncio
+    r = await async_call(client, semaphore, 'GET', labels_url(configuration['api_url'], repo_name))
+    success, lines = buffered(check_labels_response, r, repo_name, configuration)
+    if not success:
+        return 1, lines
+
+    all_repo_labels = await async_response_items(r, client, semaphore)
+
+    operations = label_operations(all_repo_labels, new_labels, mode)
+    # operations of one repository never touch the same label
+    results = await asyncio.gather(*[async_request_run(configuration, client, semaphore, repo_name, *operation)
+                                     for operation in operations])
+    number_errors = 0
+    for success, output in results:
+        lines.extend(output)
+        if not success:
+            number_errors = number_errors + 1
+
+    if new_labels is None:
+        # errors of removing all labels are not counted
+        return 0, lines
+    return number_errors, lines
+
+
+async def async_run(token, config_file, configuration, mode):
+    import asyncio
+    semaphore = asyncio.Semaphore(configuration['jobs'])
+    async with async_client(token, configuration['timeout']) as client:
+        repos = get_config_repos(config_file)
+        if configuration['all_repos']:
+            repos = parse_repos(await async_request(repos_url(configuration['api_url']), client, semaphore))
+
+        new_labels = config_file['labels']
+        name = get_template_repo(config_file, configuration)
+        if name:
+            template_url = labels_url(configuration['api_url'], name)
+            new_labels = parse_labels(await async_request(template_url, client, semaphore))
+        if mode == "replace" and not config_file['labels']:
+            # remove all labels if is mode replace and labels in config file is empty
+            new_labels = None
+
+        tasks = [asyncio.ensure_future(async_sync_repo(repo, client, semaphore, new_labels, configuration, mode))
+                 for repo in repos]
+        all_errors = 0
+        # print output of repositories in order of configuration
+        for task in tasks:
+            errors, lines = await task
+            for line in lines:
+                echo(line)
+            all_errors = all_errors + errors
+
+    return len(repos), all_errors
+
+# WEBHOOK SERVER
+
+
+class RepoQueue:
+    # repositories waiting for reconciliation, events of one repository arriving
+    # within delay are coalesced and a repository is never reconciled twice at once
+
+    def __init__(self, delay, repos=None):
+        self.delay = delay
+        # None accepts any repository (--all-repos)
+        self.repos = None if repos is None else set(repos)
+        self.condition = threading.Condition()
+        # repository -> time when it should be reconciled
+        self.pending = {}
+        self.running = set()
+
+    def put(self, repo_name, force=False):
+        # force queues also repository which is not reconciled (template)
+        with self.condition:
+            if not force and self.repos is not None and repo_name not in self.repos:
+                return False
+            if repo_name not in self.pending:
+                self.pending[repo_name] = time.time() + self.delay
+                self.condition.notify_all()
+            return True
+
+    def rename(self, old_name, new_name):
+        with self.condition:
+            if self.repos is not None and old_name in self.repos:
+                self.repos.discard(old_name)
+                self.repos.add(new_name)
+
+    def get(self):
+        with self.condition:
+            while True:
+                ready = [(due, repo_name) for repo_name, due in self.pending.items() if repo_name not in self.running]
+                timeout = None
+                if ready:
+                    due, repo_name = min(ready)
+                    timeout = due - time.time()
+                    if timeout <= 0:
+                        del self.pending[repo_name]
+                        self.running.add(repo_name)
+                        return repo_name
+                self.condition.wait(timeout)
+
+    def done(self, repo_name):
+        with self.condition:
+            self.running.discard(repo_name)
+            self.condition.notify_all()
+
+    def join(self):
+        # wait until all queued repositories are reconciled
+        with self.condition:
+            while self.pending or self.running:
+                self.condition.wait()
+
+
+class DesiredLabels:
+    # labels from config file or template repository, replaced when template changes
+
+    def __init__(self, new_labels, mode):
+        self.lock = threading.Lock()
+        self.mode = mode
+        self.set(new_labels)
+
+    def set(self, new_labels):
+        fingerprint = labels_fingerprint(new_labels, self.mode)
+        with self.lock:
+            self.new_labels = new_labels
+            self.fingerprint = fingerprint
+
+    def get(self):
+        with self.lock:
+            return self.new_labels, self.fingerprint
+
+
+def verify_signature(secret, body, signature):
+    # X-Hub-Signature-256 (or older X-Hub-Signature) is HMAC of body keyed by webhook secret
+    import hashlib
+    import hmac
+    algorithm, _, digest = (signature or '').partition('=')
+    if algorithm not in ('sha256', 'sha1'):
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, getattr(hashlib, algorithm)).hexdigest()
+    return hmac.compare_digest(expected, digest)
+
+
+def handle_webhook(event, payload, queue, template_repo):
+    # enqueue repository affected by event, returns short description of what has been done
+    if event == 'ping':
+        return 'pong'
+    repository = payload.get('repository') or {}
+    repo_name = repository.get('full_name')
+    if not repo_name:
+        return 'ignored'
+
+    if event == 'label':
+        if template_repo and repo_name.lower() == template_repo.lower():
+            # desired state itself has changed, worker reads the template and queues
+            # all repositories, GitHub does not wait for that (10 s timeout of delivery)
+            queue.put(TEMPLATE_REFRESH, force=True)
+            return 'queued'
+        return 'queued' if queue.put(repo_name) else 'ignored'
+
+    if event == 'repository' and payload.get('action') == 'renamed':
+        old_name = payload.get('changes', {}).get('repository', {}).get('name', {}).get('from')
+        if old_name:
+            owner = repo_name.split('/')[0]
+            queue.rename('{}/{}'.format(owner, old_name), repo_name)
+        return 'queued' if queue.put(repo_name) else 'ignored'
+
+    if event == 'repository' and payload.get('action') == 'created':
+        return 'queued' if queue.put(repo_name) else 'ignored'
+    return 'ignored'
+
+
+def create_webhook_app(secret, handle):
+    from flask import Flask, abort, request as flask_request
+
+    app = Flask(__name__)
+
+    @app.route('/', methods=['POST'])
+    def webhook():
+        signature = flask_request.headers.get('X-Hub-Signature-256') or flask_request.headers.get('X-Hub-Signature')
+        if not verify_signature(secret, flask_request.get_data(), signature):
+            abort(401)
+        event = flask_request.headers.get('X-GitHub-Event', '')
+        return handle(event, flask_request.get_json(silent=True) or {})
+
+    return app
+
+
+def refresh_desired_labels(config_file, configuration, session, mode, desired):
+    # read template repository again, returns repositories to reconcile or None on failure
+    try:
+        desired.set(get_new_labels(config_file, configuration, session, mode))
+        return get_repos(config_file, configuration, session)
+    except (Exception, SystemExit):
+        if is_jsonl(configuration):
+            emit({"type": "template", "result": "ERR"})
+        elif not configuration['quiet']:
+            echo("Template repository cannot be read, keeping the previous labels")
+        return None
+
+
+def reconcile_repo(repo_name, session, desired, configuration, mode):
+    new_labels, fingerprint = desired.get()
+    repo_configuration = dict(configuration, fingerprint=fingerprint, skipped=[])
+    try:
+        errors = sync_repo(repo_name, session, None, new_labels, repo_configuration, mode)
+    except (Exception, SystemExit) as e:
+        # failure of one repository must not stop the worker serving others
+        report_reconcile(repo_configuration, repo_name, 1, error_message(e))
+        return 1
+    report_reconcile(repo_configuration, repo_name, errors)
+    return errors
+
+
+def report_reconcile(configuration, repo_name, errors, message=None):
+    is_quiet = configuration['quiet']
+    is_verbose = configuration['verbose']
+    if message is not None:
+        result = "failed ({})".format(message)
+    elif errors > 0:
+        result = "{} error(s)".format(errors)
+    elif configuration['skipped']:
+        result = "skipped as unchanged"
+    else:
+        result = "updated successfully"
+    if is_jsonl(configuration):
+        record = {"type": "reconcile", "repo": repo_name, "result": "ERR" if errors > 0 else "SUC",
+                  "errors": errors, "skipped": bool(configuration['skipped'])}
+        if message is not None:
+            record["message"] = message
+        emit(record)
+    elif not is_quiet and is_verbose:
+        echo("[SYNC] {}; {}".format(repo_name, result))
+    elif (is_quiet and is_verbose) or (not is_quiet and not is_verbose):
+        echo("SYNC: {}; {}".format(repo_name, result))
+
+
+# output of one reconciliation is printed at once
+_reconcile_lock = threading.Lock()
+
+
+def reconcile_worker(queue, refresh, session, desired, configuration, mode):
+    while True:
+        repo_name = queue.get()
+        try:
+            if repo_name == TEMPLATE_REFRESH:
+                repos, lines = buffered(refresh)
+                for name in repos or []:
+                    queue.put(name)
+            else:
+                _, lines = buffered(reconcile_repo, repo_name, session, desired, configuration, mode)
+            with _reconcile_lock:
+                for line in lines:
+                    echo(line)
+        finally:
+            queue.done(repo_name)
+
+
+def start_reconcile_workers(jobs, *args):
+    for _ in range(jobs):
+        threading.Thread(target=reconcile_worker, args=args, daemon=True).start()
 
 # PUBLIC FUNCTIONS
 
@@ -331,12 +2037,43 @@ def remove_labels_from_all_repos(session, configuration, repos):
 @click.option('-c', "--config", default="./config.cfg",
               help="Path of the auth config file.")
 @click.option('-t', "--token", envvar='GITHUB_TOKEN',
-              help="GitHub API token.")
+              help="GitHub API token (several tokens can be separated by commas).")
+@click.option('-b', "--backend", default="requests", type=click.Choice(['requests', 'asyncio']),
+              callback=check_backend, help="HTTP client used for GitHub API calls.")
+@click.option("--api-url", envvar='GITHUB_API_URL', default=API_URL,
+              help="Base URL of GitHub API (e.g. of GitHub Enterprise or of a mock server).")
+@click.option("--cache-dir", envvar='LABELORD_CACHE_DIR', default=default_cache_dir,
+              help="Directory for cached GitHub responses.")
+@click.option("--cache-size", default=CACHE_SIZE, type=click.IntRange(1, None),
+              help="Size limit of cached responses in MB.")
+@click.option("--no-cache", is_flag=True, help="Do not use cached GitHub responses.")
+@click.option("--inventory-ttl", default=INVENTORY_TTL, type=click.IntRange(0, None),
+              help="Seconds for which cached list of all repositories (--all-repos) is used without asking GitHub.")
+@click.option("--retries", default=3, type=click.IntRange(0, None),
+              help="How many times is request failed due to transient error repeated.")
+@click.option("--retry-backoff", default=1.0, type=float,
+              help="Base of exponential backoff between retries in seconds.")
+@click.option("--timeout", default=REQUEST_TIMEOUT, type=float, help="Timeout of one HTTP request in seconds.")
+@click.option("--pool-size", default=None, type=click.IntRange(1, None),
+              help="Connections kept alive for reuse (by default enough for all parallel requests).")
+@click.option("--prewarm", is_flag=True, help="Open connections for all jobs before the first request.")
 @click.option('--version', is_flag=True, callback=print_version,
               expose_value=False, is_eager=True, help="Show the version and exit.")
-def cli(ctx, config, token):
+def cli(ctx, config, token, backend, api_url, cache_dir, cache_size, no_cache, inventory_ttl, retries, retry_backoff,
+        timeout, pool_size, prewarm):
     ctx.obj['token'] = token
     ctx.obj['config'] = config
+    ctx.obj['backend'] = backend
+    ctx.obj['api_url'] = api_url
+    ctx.obj['cache_dir'] = cache_dir
+    ctx.obj['cache_size'] = cache_size
+    ctx.obj['no_cache'] = no_cache
+    ctx.obj['inventory_ttl'] = inventory_ttl
+    ctx.obj['retries'] = retries
+    ctx.obj['retry_backoff'] = retry_backoff
+    ctx.obj['timeout'] = timeout
+    ctx.obj['pool_size'] = pool_size
+    ctx.obj['prewarm'] = prewarm
 
 
 @cli.command()
@@ -345,7 +2082,10 @@ def list_repos(ctx):
     """Listing accessible repositories."""
     prepare_session(ctx)
     session = ctx.obj['session']
-    print_repos(session)
+    if ctx.obj['backend'] == 'asyncio':
+        run_async(async_print_all(ctx.obj['token'], ctx.obj['timeout'], repos_url(session.api_url), print_repos))
+    else:
+        print_repos(request_items(repos_url(session.api_url), session))
 
 
 @cli.command()
@@ -355,7 +2095,11 @@ def list_labels(ctx, repository):
     """Listing labels of desired repository."""
     prepare_session(ctx)
     session = ctx.obj['session']
-    print_labels(session, repository)
+    if ctx.obj['backend'] == 'asyncio':
+        url = labels_url(session.api_url, repository)
+        run_async(async_print_all(ctx.obj['token'], ctx.obj['timeout'], url, print_labels))
+    else:
+        print_labels(request_items(labels_url(session.api_url, repository), session))
 
 
 @cli.command()
@@ -366,41 +2110,264 @@ def list_labels(ctx, repository):
 @click.option("-d", "--dry-run", is_flag=True, help="Proceed with just dry run.")
 @click.option("-v", "--verbose", is_flag=True, help="Really exhaustive output.")
 @click.option("-q", "--quiet", is_flag=True, help="No output at all.")
+@click.option("-j", "--jobs", default=None, type=click.IntRange(1, None),
+              help="Number of repositories processed in parallel, requests in flight with asyncio backend "
+                   "(1, or {} with asyncio backend by default).".format(ASYNC_JOBS))
+@click.option("-g", "--graphql", is_flag=True, help="Read labels of repositories in batches via GraphQL API.")
+@click.option("--stats", is_flag=True, help="Print latency and throughput of HTTP requests (requests backend only).")
+@click.option("--metrics-file", type=click.Path(dir_okay=False),
+              help="Write OpenMetrics text file with metrics of the run (for node exporter textfile collector).")
+@click.option("-o", "--output", default="text", type=click.Choice(['text', 'jsonl']),
+              help="Output format, jsonl prints one JSON record per operation regardless of -v and -q.")
+@click.option("--snapshot", type=click.File('r'),
+              help="Dry run offline with labels read from file written by snapshot command.")
+@click.option("--snapshot-max-age", default=SNAPSHOT_MAX_AGE, type=click.IntRange(0, None),
+              help="Seconds after which the snapshot is reported as stale.")
 @click.pass_context
 def run(ctx, mode, **configuration):
     """Run labels processing."""
-    prepare_session(ctx)
+    if configuration['snapshot'] is not None and not configuration['dry_run']:
+        raise click.BadParameter("snapshot can be used only with --dry-run", param_hint='--snapshot')
+    is_async = ctx.obj['backend'] == 'asyncio'
+    if is_async and configuration['graphql']:
+        raise click.BadParameter("GraphQL is not supported by asyncio backend", param_hint='--graphql')
+    if configuration['jobs'] is None:
+        configuration['jobs'] = ASYNC_JOBS if is_async else 1
+    configuration['started'] = time.time()
+    configuration['outcomes'] = {}
+    if is_jsonl(configuration):
+        use_jsonl_errors(ctx)
+        use_buffered_output(ctx)
+    prepare_session(ctx, configuration['jobs'], offline=configuration['snapshot'] is not None)
     session = ctx.obj['session']
     config = ctx.obj['config_file']
     config_file = setup_config(config)
+    if configuration['snapshot'] is not None:
+        # nothing is read from GitHub
+        configuration['snapshot'] = load_snapshot(configuration)
+    elif is_async:
+        configuration['api_url'] = session.api_url
+        configuration['timeout'] = ctx.obj['timeout']
+        len_repos, all_errors = run_async(async_run(ctx.obj['token'], config_file, configuration, mode))
+        run_response(configuration, len_repos, all_errors)
+
+    len_repos, all_errors = sync_all(session, config_file, configuration, mode)
+    run_response(configuration, len_repos, all_errors)
+
+
+@cli.command()
+@click.argument('mode', nargs=1, type=click.Choice(['update', 'replace']))
+@click.option('-r', "--template-repo", default="",
+              help="Repository which serves as labels template.")
+@click.option("-a", "--all-repos", is_flag=True, help="Run for all repositories available.")
+@click.option("-d", "--dry-run", is_flag=True, help="Proceed with just dry run.")
+@click.option("-v", "--verbose", is_flag=True, help="Really exhaustive output.")
+@click.option("-q", "--quiet", is_flag=True, help="No output at all.")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(1, None),
+              help="Number of repositories processed in parallel.")
+@click.option("-g", "--graphql", is_flag=True, help="Read labels of repositories in batches via GraphQL API.")
+@click.option("-i", "--interval", default=WATCH_INTERVAL, type=float, help="Seconds between runs.")
+@click.option("-n", "--iterations", default=0, type=click.IntRange(0, None),
+              help="Stop after this number of runs (0 runs forever).")
+@click.option("--stats", is_flag=True, help="Print latency and throughput of HTTP requests after each run.")
+@click.option("--metrics-file", type=click.Path(dir_okay=False),
+              help="Write OpenMetrics text file with metrics of each run (for node exporter textfile collector).")
+@click.option("-o", "--output", default="text", type=click.Choice(['text', 'jsonl']),
+              help="Output format, jsonl prints one JSON record per operation regardless of -v and -q.")
+@click.pass_context
+def watch(ctx, mode, **configuration):
+    """Run labels processing repeatedly, reload config file when it changes."""
+    import requests
+    if is_jsonl(configuration):
+        use_jsonl_errors(ctx)
+        use_buffered_output(ctx)
+    prepare_session(ctx, configuration['jobs'])
+    session = ctx.obj['session']
+    config = ctx.obj['config_file']
+    config_file = setup_config(config)
+    config_mtime = file_mtime(config)
+
+    iteration = 0
+    all_errors = 0
+    try:
+        while True:
+            # session and its caches stay warm, unchanged repositories are answered by 304 - Not Modified
+            configuration['started'] = time.time()
+            configuration['outcomes'] = {}
+            try:
+                len_repos, all_errors = sync_all(session, config_file, configuration, mode)
+            except (requests.RequestException, SystemExit) as e:
+                # run which cannot be finished (GitHub or network down) does not stop watching
+                all_errors = 1
+                report_failed_run(configuration, e)
+            else:
+                report_run(configuration, len_repos, all_errors)
+            flush_output()
+
+            iteration = iteration + 1
+            if configuration['iterations'] and iteration >= configuration['iterations']:
+                break
+            wait_for_change(config, config_mtime, configuration['interval'])
+            if file_mtime(config) != config_mtime:
+                config_mtime = file_mtime(config)
+                config_file = reload_config(config, config_file, configuration)
+    except KeyboardInterrupt:
+        pass
+
+    if all_errors > 0:
+        exit(10)
+    else:
+        exit(0)
+
+
+@cli.command()
+@click.argument('mode', nargs=1, type=click.Choice(['update', 'replace']))
+@click.argument('plan', type=click.File('w'))
+@click.option('-r', "--template-repo", default="",
+              help="Repository which serves as labels template.")
+@click.option("-a", "--all-repos", is_flag=True, help="Plan for all repositories available.")
+@click.option("-v", "--verbose", is_flag=True, help="Really exhaustive output.")
+@click.option("-q", "--quiet", is_flag=True, help="No output at all.")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(1, None),
+              help="Number of repositories read in parallel.")
+@click.option("-g", "--graphql", is_flag=True, help="Read labels of repositories in batches via GraphQL API.")
+@click.pass_context
+def plan(ctx, mode, plan, **configuration):
+    """Write labels operations to plan file."""
+    import json
+    prepare_session(ctx, configuration['jobs'])
+    session = ctx.obj['session']
+    config_file = setup_config(ctx.obj['config_file'])
     repos = get_repos(config_file, configuration, session)
+    new_labels = get_new_labels(config_file, configuration, session, mode)
+    repo_labels = read_repos_labels(repos, session, new_labels, configuration, mode)
+    planned = []
     all_errors = 0
-    new_labels = config_file['labels']
-    # check if exist template repo
-    if configuration['template_repo'] or ("others" in config_file):
-        if configuration['template_repo']:
-            name = configuration['template_repo']
+    for repo, operations in zip(repos, map_repos(repos, configuration['jobs'], plan_repo, session, repo_labels,
+                                                 new_labels, configuration, mode)):
+        if operations is None:
+            all_errors = all_errors + 1
         else:
-            name = config_file['others']['template-repo']
-        new_labels = new_labels_from_template(name, session)
+            planned.append([repo, operations])
 
-    if mode == "replace" and not config_file['labels']:
-        # remove all labels if is mode replace and labels in config file is empty
-        remove_labels_from_all_repos(session, configuration, repos)
+    json.dump({'mode': mode, 'remove_all': new_labels is None, 'created': int(time.time()), 'repos': planned}, plan,
+              separators=(',', ':'))
+    plan_response(configuration, planned, all_errors)
+
+
+@cli.command()
+@click.argument('snapshot', type=click.File('w'))
+@click.option('-r', "--template-repo", default="",
+              help="Repository which serves as labels template.")
+@click.option("-a", "--all-repos", is_flag=True, help="Capture all repositories available.")
+@click.option("-v", "--verbose", is_flag=True, help="Really exhaustive output.")
+@click.option("-q", "--quiet", is_flag=True, help="No output at all.")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(1, None),
+              help="Number of repositories read in parallel.")
+@click.option("-g", "--graphql", is_flag=True, help="Read labels of repositories in batches via GraphQL API.")
+@click.pass_context
+def snapshot(ctx, snapshot, **configuration):
+    """Write current labels of repositories to file for offline dry run."""
+    import json
+    prepare_session(ctx, configuration['jobs'])
+    session = ctx.obj['session']
+    config_file = setup_config(ctx.obj['config_file'])
+    repos = get_repos(config_file, configuration, session)
+    templates = {}
+    name = get_template_repo(config_file, configuration)
+    if name:
+        templates[name] = [{'name': label_name, 'color': color}
+                           for label_name, color in new_labels_from_template(name, session).items()]
+
+    if configuration['graphql']:
+        repo_labels = graphql_labels(session, repos)
+        for repo_name in repos:
+            if repo_labels[repo_name] is None:
+                check_labels_status(404, repo_name, configuration)
     else:
-        # analyze each repo in github
-        for repo in repos:
-            repo_name = repo
-            all_repo_labels = labels_for_run(session, repo_name, configuration)
-            # analyze each label in repository
-            if all_repo_labels != 0:
-                result = analyze_labels_with_new(session, repo_name, all_repo_labels,
-                                                new_labels, configuration, mode)
-                all_errors = all_errors + result
-            else:
-                all_errors = all_errors + 1
+        repo_labels = dict(zip(repos, map_repos(repos, configuration['jobs'], snapshot_repo, session, configuration)))
+    all_errors = sum(1 for labels in repo_labels.values() if labels is None)
 
-    run_response(configuration, len(repos), all_errors)
+    json.dump({'created': int(time.time()), 'repos': repo_labels, 'templates': templates}, snapshot,
+              separators=(',', ':'))
+    snapshot_response(configuration, len(repos) - all_errors, all_errors)
+
+
+@cli.command()
+@click.argument('plan', type=click.File('r'))
+@click.option("-v", "--verbose", is_flag=True, help="Really exhaustive output.")
+@click.option("-q", "--quiet", is_flag=True, help="No output at all.")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(1, None),
+              help="Number of operations processed in parallel.")
+@click.option("-o", "--output", default="text", type=click.Choice(['text', 'jsonl']),
+              help="Output format, jsonl prints one JSON record per operation regardless of -v and -q.")
+@click.pass_context
+def apply(ctx, plan, **configuration):
+    """Apply labels operations from plan file."""
+    if is_jsonl(configuration):
+        use_jsonl_errors(ctx)
+        use_buffered_output(ctx)
+    planned, remove_all = load_plan(plan)
+    prepare_session(ctx, configuration['jobs'])
+    session = ctx.obj['session']
+    configuration['dry_run'] = False
+    # operations of one repository never touch the same label
+    operations = [(repo, operation) for repo, repo_operations in planned for operation in repo_operations]
+    results = map_repos(operations, configuration['jobs'], apply_planned, session, configuration)
+    all_errors = sum(1 for success in results if not success)
+    if remove_all:
+        # errors of removing all labels are not counted, as in run
+        all_errors = 0
+
+    configuration['retried'] = session.retry_policy.count
+    run_response(configuration, len(planned), all_errors)
+
+
+@cli.command('serve-webhook')
+@click.argument('mode', nargs=1, type=click.Choice(['update', 'replace']))
+@click.option('-r', "--template-repo", default="",
+              help="Repository which serves as labels template.")
+@click.option("-a", "--all-repos", is_flag=True, help="Accept events of all repositories available.")
+@click.option("-d", "--dry-run", is_flag=True, help="Proceed with just dry run.")
+@click.option("-v", "--verbose", is_flag=True, help="Really exhaustive output.")
+@click.option("-q", "--quiet", is_flag=True, help="No output at all.")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(1, None),
+              help="Number of repositories reconciled in parallel.")
+@click.option("--delay", default=WEBHOOK_DELAY, type=float,
+              help="Seconds for which events of one repository are collected before it is reconciled.")
+@click.option("--secret", envvar='LABELORD_WEBHOOK_SECRET',
+              help="Secret of GitHub webhook (webhook_secret in [github] section of config file by default).")
+@click.option("--host", default="127.0.0.1", help="Address to listen on.")
+@click.option("-p", "--port", default=5000, type=click.IntRange(0, 65535), help="Port to listen on.")
+@click.option("-o", "--output", default="text", type=click.Choice(['text', 'jsonl']),
+              help="Output format, jsonl prints one JSON record per operation regardless of -v and -q.")
+@click.pass_context
+def serve_webhook(ctx, mode, **configuration):
+    """Reconcile repositories when GitHub webhook reports change of their labels."""
+    try:
+        import flask  # noqa: F401
+    except ImportError:
+        click.echo("serve-webhook requires flask package to be installed")
+        exit(1)
+    if is_jsonl(configuration):
+        use_jsonl_errors(ctx)
+    prepare_session(ctx, configuration['jobs'])
+    session = ctx.obj['session']
+    config_file = setup_config(ctx.obj['config_file'])
+    secret = configuration['secret'] or config_file.get('github', 'webhook_secret', fallback=None)
+    if not secret:
+        report_error("No webhook secret has been provided", 8)
+
+    configuration['graphql'] = False
+    desired = DesiredLabels(get_new_labels(config_file, configuration, session, mode), mode)
+    queue = RepoQueue(configuration['delay'], None if configuration['all_repos'] else get_config_repos(config_file))
+    refresh = partial(refresh_desired_labels, config_file, configuration, session, mode, desired)
+    handle = partial(handle_webhook, queue=queue, template_repo=get_template_repo(config_file, configuration))
+    ctx.obj['webhook_queue'] = queue
+    start_reconcile_workers(configuration['jobs'], queue, refresh, session, desired, configuration, mode)
+    create_webhook_app(secret, handle).run(host=configuration['host'], port=configuration['port'], threaded=True)
+    # server has been stopped, repositories already queued are finished
+    queue.join()
 
 
 if __name__ == '__main__':
@@ -76,6 +76,13 @@ class Utils:
         return CONFIGS_PATH + '/' + name + '.cfg'
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    # responses cached by labelord are kept just for single test
+    monkeypatch.setenv('LABELORD_CACHE_DIR', str(tmpdir))
+    return str(tmpdir)
+
+
 @pytest.fixture
 def utils():
     return Utils()
@@ -5,6 +5,24 @@ REPO_JSON = '{\"issues_url\": \"https://api.github.com/repos/MarekSuchanek/repoX
 LABEL_JSON = '{\"id\": 493652ZZZ, \"url\": \"https://api.github.com/repos/MarekSuchanek/repo1/labels/labelXXX\", \"name\": \"labelXXX\", \"color\": \"ABCZZZ\", \"default\": true}'
 
 
+def make_repos(start, end):
+    data = []
+    for i in range(start, end):
+        string = REPO_JSON.replace('repoXXX', 'repo{}'.format(i))
+        string = string.replace('ZZZ', '{}'.format(i+100))
+        data.append(json.loads(string))
+    return data
+
+
+def make_labels(start, end):
+    data = []
+    for i in range(start, end):
+        string = LABEL_JSON.replace('labelXXX', 'label{}'.format(i))
+        string = string.replace('ZZZ', '{}'.format(i+100))
+        data.append(json.loads(string))
+    return data
+
+
 @click.group()
 def cli():
     pass
@@ -28,24 +46,14 @@ def json2string(json_file):
 @click.argument('start', type=click.INT)
 @click.argument('end', type=click.INT)
 def generate_repos(start, end):
-    data = []
-    for i in range(start, end):
-        string = REPO_JSON.replace('repoXXX', 'repo{}'.format(i))
-        string = string.replace('ZZZ', '{}'.format(i+100))
-        data.append(json.loads(string))
-    click.echo(json.dumps(data, indent=2, sort_keys=False))
+    click.echo(json.dumps(make_repos(start, end), indent=2, sort_keys=False))
 
 
 @cli.command()
 @click.argument('start', type=click.INT)
 @click.argument('end', type=click.INT)
 def generate_labels(start, end):
-    data = []
-    for i in range(start, end):
-        string = LABEL_JSON.replace('labelXXX', 'label{}'.format(i))
-        string = string.replace('ZZZ', '{}'.format(i+100))
-        data.append(json.loads(string))
-    click.echo(json.dumps(data, indent=2, sort_keys=False))
+    click.echo(json.dumps(make_labels(start, end), indent=2, sort_keys=False))
 
 
 if __name__ == '__main__':
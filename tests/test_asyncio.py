@@ -0,0 +1,120 @@
+# Testing asyncio backend of labelord, aiohttp cannot be replayed by betamax
+# so requests go to fake GitHub API served in process (benchmarks/github.py)
+# repo0, repo1, repo2 = [(label0, ABC100), (label1, ABC101), (label2, ABC102), (label3, ABC103), (label4, ABC104)]
+import asyncio
+import os
+import sys
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from github import FakeGitHub  # noqa: E402
+
+
+@pytest.fixture
+def github():
+    # labels and repositories are listed by pages of 2 items
+    github = FakeGitHub(3, 5, page_size=2).start()
+    yield github
+    github.stop()
+
+
+@pytest.fixture
+def config(tmpdir):
+    path = tmpdir.join('config.cfg')
+    path.write('[github]\n'
+               'token = thisIsNotRealToken\n'
+               '[labels]\n'
+               'label0 = ABC100\n'
+               'label1 = FF0000\n'
+               'label9 = 00FF00\n'
+               '[repos]\n'
+               'MarekSuchanek/repo0 = on\n'
+               'MarekSuchanek/repo2 = on\n')
+    return str(path)
+
+
+def test_asyncio_list_labels(invoker_norec, github, config):
+    invocation = invoker_norec('-c', config, '-b', 'asyncio', '--api-url', github.url,
+                               'list_labels', 'MarekSuchanek/repo1')
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['#ABC{} label{}'.format(i + 100, i) for i in range(5)] + ['']
+    assert github.counts == {'labels': 3}
+
+
+def test_asyncio_update(invoker_norec, github, config):
+    invocation = invoker_norec('-c', config, '-b', 'asyncio', '--api-url', github.url,
+                               'run', 'update', '-v')
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert sorted(lines) == ['',
+                             '[ADD][SUC] MarekSuchanek/repo0; label9; 00FF00',
+                             '[ADD][SUC] MarekSuchanek/repo2; label9; 00FF00',
+                             '[SUMMARY] 2 repo(s) updated successfully',
+                             '[UPD][SUC] MarekSuchanek/repo0; label1; FF0000',
+                             '[UPD][SUC] MarekSuchanek/repo2; label1; FF0000']
+    assert lines[-2] == '[SUMMARY] 2 repo(s) updated successfully'
+    assert github.counts == {'labels': 6, 'create': 2, 'update': 2}
+
+
+def test_asyncio_replace_all_repos(invoker_norec, github, config):
+    invocation = invoker_norec('-c', config, '-b', 'asyncio', '--api-url', github.url,
+                               'run', 'replace', '-a', '-j', '4')
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['SUMMARY: 3 repo(s) updated successfully', '']
+    assert github.counts == {'repos': 2, 'labels': 9, 'create': 3, 'update': 3, 'delete': 9}
+
+
+def test_asyncio_not_found(invoker_norec, github, config, tmpdir):
+    # repo7 does not exist, other repositories are updated
+    tmpdir.join('config.cfg').write('MarekSuchanek/repo7 = on\n', mode='a')
+    invocation = invoker_norec('-c', config, '-b', 'asyncio', '--api-url', github.url,
+                               'run', 'update')
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert lines == ['ERROR: LBL; MarekSuchanek/repo7; 404 - Not Found',
+                     'SUMMARY: 1 error(s) in total, please check log above',
+                     '']
+
+
+def test_asyncio_default_jobs(invoker_norec, github, config, monkeypatch):
+    # without --jobs many requests are in flight at once
+    import labelord
+    semaphores = []
+
+    def semaphore(value):
+        semaphores.append(value)
+        return asyncio.BoundedSemaphore(value)
+
+    monkeypatch.setattr(asyncio, 'Semaphore', semaphore)
+    invocation = invoker_norec('-c', config, '-b', 'asyncio', '--api-url', github.url,
+                               'run', 'update')
+
+    assert invocation.result.exit_code == 0
+    assert semaphores == [labelord.ASYNC_JOBS]
+
+
+def test_asyncio_timeout(invoker_norec, config):
+    github = FakeGitHub(1, 1, latency={'all': lambda rnd: 1.0}).start()
+    try:
+        invocation = invoker_norec('-c', config, '-b', 'asyncio', '--api-url', github.url, '--timeout', '0.2',
+                                   'list_labels', 'MarekSuchanek/repo0')
+    finally:
+        github.stop()
+
+    assert isinstance(invocation.result.exception, asyncio.TimeoutError)
+
+
+def test_asyncio_graphql(invoker_norec, config):
+    invocation = invoker_norec('-c', config, '-b', 'asyncio', 'run', 'update', '--graphql')
+
+    assert invocation.result.exit_code == 2
+    assert 'GraphQL is not supported by asyncio backend' in invocation.result.output
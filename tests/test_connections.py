@@ -0,0 +1,101 @@
+# Testing pool of connections shared by workers of run, betamax replaces adapters
+# of session so requests go to fake GitHub API served in process (benchmarks/github.py)
+import json
+import os
+import re
+import sys
+import pytest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from github import FakeGitHub  # noqa: E402
+import labelord  # noqa: E402
+
+STATS_LINE = re.compile(r'^STATS: (\d+) connection\(s\) opened for (\d+) request\(s\), (\d+\.\d)% reused$')
+
+
+@pytest.fixture
+def github():
+    github = FakeGitHub(4, 5).start()
+    yield github
+    github.stop()
+
+
+@pytest.fixture
+def config(tmpdir):
+    path = tmpdir.join('config.cfg')
+    path.write('[github]\n'
+               'token = thisIsNotRealToken\n'
+               '[labels]\n'
+               'label0 = ABC100\n'
+               'label1 = FF0000\n'
+               '[repos]\n' +
+               ''.join('MarekSuchanek/repo{} = on\n'.format(i) for i in range(4)))
+    return str(path)
+
+
+def invoke(*args):
+    # no session in obj, so labelord creates its pooled session
+    obj = {}
+    result = CliRunner().invoke(labelord.cli, list(args), obj=obj)
+    return result, obj['session']
+
+
+def connections_line(output):
+    matches = [STATS_LINE.match(line) for line in output.split('\n')]
+    matches = [match for match in matches if match]
+    assert len(matches) == 1
+    return tuple(int(number) for number in matches[0].groups()[:2]), float(matches[0].group(3))
+
+
+def pool_size(session, url):
+    return session.get_adapter(url)._pool_maxsize
+
+
+def test_run_connections_reused(github, config):
+    result, session = invoke('-c', config, '--api-url', github.url, 'run', 'update', '-j', '2', '--stats')
+
+    # 4x GET labels, 4x PATCH label1
+    assert result.exit_code == 0
+    assert pool_size(session, github.url) == 2 * labelord.PAGE_WORKERS
+    (connections, requests_count), reused = connections_line(result.output)
+    assert requests_count == 8
+    assert 1 <= connections <= 2
+    assert reused == round(100 * (requests_count - connections) / requests_count, 1)
+
+
+def test_run_connections_pool_size(github, config):
+    result, session = invoke('-c', config, '--api-url', github.url, '--pool-size', '3',
+                             'run', 'update', '-j', '4', '--stats')
+
+    assert result.exit_code == 0
+    assert pool_size(session, github.url) == 3
+    (connections, requests_count), _ = connections_line(result.output)
+    assert requests_count == 8
+    assert 1 <= connections <= 4
+
+
+def test_run_connections_prewarm(github, config):
+    result, _ = invoke('-c', config, '--api-url', github.url, '--prewarm',
+                       'run', 'update', '-j', '2', '--stats')
+
+    # prewarming requests are sent through the same pool
+    assert result.exit_code == 0
+    assert github.requests() == 10
+    (connections, requests_count), _ = connections_line(result.output)
+    assert requests_count == 10
+    assert 1 <= connections <= 2
+
+
+def test_run_connections_jsonl(github, config):
+    result, _ = invoke('-c', config, '--api-url', github.url, 'run', 'update', '-j', '2', '--stats',
+                       '-o', 'jsonl')
+
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.split('\n') if line]
+    pooled = [record for record in records if 'pooled_requests' in record]
+    assert len(pooled) == 1
+    assert pooled[0]['type'] == 'stats'
+    assert pooled[0]['pooled_requests'] == 8
+    assert 1 <= pooled[0]['connections'] <= 2
@@ -79,3 +79,55 @@ def test_list_more_than_hundred(invoker, utils):
     assert len(lines) == 155 and lines[-1] == ''
     for i in range(154):
         assert '#ABC{} label{}'.format(i+100, i) in lines
+
+
+def test_list_not_modified(invoker, utils):
+    # Second listing is answered with 304 - Not Modified,
+    # labels must be printed from cached response
+    for _ in range(2):
+        invocation = invoker('--config', utils.config('config_token'),
+                             'list_labels', 'MarekSuchanek/repo1',
+                             session_expectations={'get': 1})
+        lines = invocation.result.output.split('\n')
+
+        assert invocation.result.exit_code == 0
+        assert len(lines) == 13 and lines[-1] == ''
+        assert '#ee0701 bug' in lines
+        assert '#cccccc wontfix' in lines
+
+
+def test_list_no_cache(invoker, utils):
+    # With --no-cache nothing is stored, so the second listing
+    # sends unconditional request and gets 200 again
+    for _ in range(2):
+        invocation = invoker('--config', utils.config('config_token'), '--no-cache',
+                             'list_labels', 'MarekSuchanek/repo1',
+                             session_expectations={'get': 1})
+        lines = invocation.result.output.split('\n')
+
+        assert invocation.result.exit_code == 0
+        assert len(lines) == 13 and lines[-1] == ''
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    # Responses over the size limit are evicted starting with
+    # the least recently used one, cache without sizes is dropped
+    import sqlite3
+    from labelord import ResponseCache
+    path = str(tmpdir.join('responses.sqlite'))
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE responses (url TEXT PRIMARY KEY, etag TEXT, link TEXT, body BLOB, used REAL)')
+    connection.execute("INSERT INTO responses VALUES ('old', 'etag', NULL, 'body', 0)")
+    connection.commit()
+    connection.close()
+
+    cache = ResponseCache(path, 10)
+    assert cache.get('old') is None
+    cache.set('a', 'etag', None, b'1234')
+    cache.set('b', 'etag', None, b'1234')
+    assert cache.get('a') is not None
+    cache.set('c', 'etag', None, b'1234')
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
@@ -59,3 +59,27 @@ def test_list_more_than_hundred(invoker, utils):
     assert len(lines) == 335 and lines[-1] == ''
     for i in range(334):
         assert 'MarekSuchanek/repo{}'.format(i) in lines
+
+
+def test_list_more_than_hundred_order(invoker, utils):
+    # Pages are downloaded at once but repositories must
+    # be listed in the same order as GitHub returns them
+    invocation = invoker('-c', utils.config('config_token'),
+                         'list_repos',
+                         session_expectations={'get': 4})
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines[:-1] == ['MarekSuchanek/repo{}'.format(i) for i in range(334)]
+
+
+def test_list_token_pool(invoker, utils):
+    # Config can contain several tokens separated by commas
+    invocation = invoker('--config', utils.config('config_tokens'),
+                         'list_repos',
+                         session_expectations={'get': 1})
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 7 and lines[-1] == ''
+    assert 'cvut/MI-PYT' in lines
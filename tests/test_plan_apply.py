@@ -0,0 +1,141 @@
+# All tests here use this:
+# repo1 = [(label1, FFAA00), (label3, 00FF33), (label4, 771077)]
+# repo2 = [(label2, CCAAFF)]
+import json
+import pytest
+
+
+def test_plan_apply(invoker, utils, tmpdir):
+    plan_file = str(tmpdir.join('plan.json'))
+    # GET: 2 (repo1: 1, repo2: 1)
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'plan', 'update', plan_file)
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 2 and lines[-1] == ''
+    assert lines[0] == 'SUMMARY: 4 operation(s) planned for 2 repo(s)'
+    with open(plan_file) as f:
+        plan = json.load(f)
+    assert plan['mode'] == 'update'
+    assert plan['remove_all'] is False
+    assert plan['repos'] == [
+        ['MarekSuchanek/repo1', [['ADD', '', 'label2', 'CCAAFF'],
+                                 ['UPD', 'label3', 'label3', '00FF00']]],
+        ['MarekSuchanek/repo2', [['ADD', '', 'label1', 'FFAA00'],
+                                 ['ADD', '', 'label3', '00FF00']]],
+    ]
+
+    # GET: 0
+    # POST: 3 (repo1: 1, repo2: 2)
+    # PATCH: 1 (repo1: 1, repo2: 0)
+    # DELETE: 0
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'apply', plan_file, '-v',
+                         session_expectations={
+                             'get': 0,
+                             'post': 3,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == [
+        '[ADD][SUC] MarekSuchanek/repo1; label2; CCAAFF',
+        '[UPD][SUC] MarekSuchanek/repo1; label3; 00FF00',
+        '[ADD][SUC] MarekSuchanek/repo2; label1; FFAA00',
+        '[ADD][SUC] MarekSuchanek/repo2; label3; 00FF00',
+        '[SUMMARY] 2 repo(s) updated successfully',
+        '',
+    ]
+
+
+def test_plan_verbose(invoker, utils, tmpdir):
+    # GET: 2 (repo1: 1, repo2: 1)
+    # POST: 0
+    # PATCH: 0
+    # DELETE: 0
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'plan', 'update', str(tmpdir.join('plan.json')), '-v', '-j', '2',
+                         session_expectations={
+                             'get': 2,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == [
+        '[ADD][DRY] MarekSuchanek/repo1; label2; CCAAFF',
+        '[UPD][DRY] MarekSuchanek/repo1; label3; 00FF00',
+        '[ADD][DRY] MarekSuchanek/repo2; label1; FFAA00',
+        '[ADD][DRY] MarekSuchanek/repo2; label3; 00FF00',
+        '[SUMMARY] 4 operation(s) planned for 2 repo(s)',
+        '',
+    ]
+
+
+@pytest.mark.parametrize(
+    ('remove_all', 'exit_code', 'summary'),
+    [
+        (True, 0, '[SUMMARY] 1 repo(s) updated successfully'),
+        (False, 10, '[SUMMARY] 1 error(s) in total, please check log above'),
+    ]
+)
+def test_apply_remove_all_errors(invoker, utils, tmpdir, remove_all, exit_code, summary):
+    # errors of removing all labels are not counted, as in run
+    plan_file = tmpdir.join('plan.json')
+    plan_file.write(json.dumps({'mode': 'replace', 'remove_all': remove_all, 'created': 0, 'repos': [
+        ['MarekSuchanek/repo1', [['DEL', 'label1', '', ''], ['DEL', 'label3', '', '']]],
+    ]}))
+    # DELETE: 2 (repo1: 2), label1 cannot be removed
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'apply', str(plan_file), '-v',
+                         session_expectations={
+                             'get': 0,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 2
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == exit_code
+    assert lines == [
+        '[DEL][ERR] MarekSuchanek/repo1; label1; ; 403 - Must have admin rights to Repository.',
+        '[DEL][SUC] MarekSuchanek/repo1; label3; ',
+        summary,
+        '',
+    ]
+
+
+@pytest.mark.parametrize(
+    'content',
+    [
+        '{"repos": [',
+        '[]',
+        '{"mode": "update"}',
+        '{"repos": {"MarekSuchanek/repo1": []}}',
+        '{"repos": [["MarekSuchanek/repo1"]]}',
+        '{"repos": [["MarekSuchanek/repo1", [["ADD", "", "label2"]]]]}',
+        '{"repos": [["MarekSuchanek/repo1", [["MOVE", "label1", "label2", "CCAAFF"]]]]}',
+        '{"repos": [["MarekSuchanek/repo1", [["ADD", "", "label2", 123]]]]}',
+    ],
+    ids=['invalid', 'list', 'no-repos', 'repos-dict', 'no-operations', 'short-operation', 'unknown-method',
+         'number-color']
+)
+def test_apply_bad_plan(invoker_norec, utils, tmpdir, content):
+    plan_file = tmpdir.join('plan.json')
+    plan_file.write(content)
+    invocation = invoker_norec('--config', utils.config('config_normal'),
+                               'apply', str(plan_file),
+                               session_expectations={
+                                   'get': 0,
+                                   'post': 0,
+                                   'patch': 0,
+                                   'delete': 0
+                               })
+
+    assert invocation.result.exit_code == 2
+    assert 'Invalid value for PLAN: plan ' in invocation.result.output
@@ -1,3 +1,4 @@
+import json
 import pytest
 import itertools
 
@@ -51,3 +52,19 @@ def test_run_no_repos(invoker_norec, utils, mode, printing):
     assert invocation.result.exit_code == 7
     assert len(lines) == 2 and lines[-1] == ''
     assert lines[0] == 'No repositories specification has been found'
+
+
+@pytest.mark.parametrize(
+    ('config', 'exit_code', 'message'),
+    [('config_nolabels', 6, 'No labels specification has been found'),
+     ('config_norepos', 7, 'No repositories specification has been found')]
+)
+def test_run_jsonl_config_errors(invoker_norec, utils, config, exit_code, message):
+    # With jsonl output the error is reported as JSON record
+    invocation = invoker_norec('-c', utils.config(config),
+                               'run', 'update', '--output', 'jsonl')
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == exit_code
+    assert len(lines) == 2 and lines[-1] == ''
+    assert json.loads(lines[0]) == {'type': 'error', 'message': message, 'exit': exit_code}
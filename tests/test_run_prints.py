@@ -3,6 +3,7 @@
 # repo2 = [(label2, CCAAFF)]
 # repo3 = [(label4, 666666), (label5, C0B011)]
 # repo4 = []
+import json
 
 
 def test_update_verbose(invoker, utils):
@@ -62,6 +63,27 @@ def test_update_normal(invoker, utils):
     assert lines[0] == 'SUMMARY: 2 repo(s) updated successfully'
 
 
+def test_update_stats(invoker, utils):
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'run', 'update', '--stats',
+                         session_expectations={
+                             'get': 2,
+                             'post': 3,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 6 and lines[-1] == ''
+    assert lines[0] == 'SUMMARY: 2 repo(s) updated successfully'
+    assert lines[1].startswith('STATS: labels: 2 request(s), ')
+    assert lines[2].startswith('STATS: ADD: 3 request(s), ')
+    assert lines[3].startswith('STATS: UPD: 1 request(s), ')
+    assert ', p50 ' in lines[1] and ', p95 ' in lines[1] and ', p99 ' in lines[1]
+    assert lines[4].startswith('STATS: 6 request(s), 4 operation(s) in ')
+
+
 def test_replace_normal(invoker, utils):
     invocation = invoker('-c', utils.config('config_normal'),
                          'run', 'replace', '-q', '-v',
@@ -131,6 +153,48 @@ def test_update_verbose_with_errors(invoker, utils):
     assert lines[-2] == '[SUMMARY] 5 error(s) in total, please check log above'
 
 
+def test_update_jsonl_with_errors(invoker, utils):
+    invocation = invoker('-c', utils.config('config_errors'),
+                         'run', 'update', '-q', '--output', 'jsonl', '-j', '2',
+                         session_expectations={
+                             'get': 3,
+                             'post': 5,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert len(lines) == 9 and lines[-1] == ''
+    records = [json.loads(line) for line in lines[:-1]]
+    assert {'type': 'operation', 'method': 'ADD', 'repo': 'MarekSuchanek/repo1', 'label': 'label2',
+            'color': 'CCAAFF', 'result': 'SUC'} in records
+    assert {'type': 'operation', 'method': 'UPD', 'repo': 'MarekSuchanek/repo1', 'label': 'label3',
+            'color': '00FFXX', 'result': 'ERR', 'status': 422, 'message': 'Validation Failed'} in records
+    assert {'type': 'operation', 'method': 'LBL', 'repo': 'MarekSuchanek/repo7', 'result': 'ERR',
+            'status': 404, 'message': 'Not Found'} in records
+    assert records[-1] == {'type': 'summary', 'result': 'ERR', 'repos': 3, 'errors': 5,
+                           'skipped': 0, 'retried': 0}
+
+
+def test_update_jsonl_template_not_found(invoker, utils):
+    # Error which ends the run is JSON record as well
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'run', 'update', '--output', 'jsonl', '-r', 'MarekSuchanek/repo2',
+                         session_expectations={
+                             'get': 1,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 5
+    assert len(lines) == 2 and lines[-1] == ''
+    assert json.loads(lines[0]) == {'type': 'error', 'message': 'GitHub: ERROR 404 - Not Found', 'exit': 5,
+                                    'status': 404}
+
+
 def test_replace_verbose_with_errors(invoker, utils):
     invocation = invoker('--config', utils.config('config_errors'),
                          'run', 'replace', '--verbose',
@@ -155,6 +219,100 @@ def test_replace_verbose_with_errors(invoker, utils):
     assert lines[-2] == '[SUMMARY] 5 error(s) in total, please check log above'
 
 
+def test_replace_verbose_with_errors_jobs(invoker, utils):
+    # Output of parallel run must be in the same order
+    # as output of serial run (grouped by repository)
+    invocation = invoker('--config', utils.config('config_errors'),
+                         'run', 'replace', '--verbose', '-j', '3',
+                         session_expectations={
+                             'get': 3,
+                             'post': 5,
+                             'patch': 1,
+                             'delete': 1
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert lines == [
+        '[DEL][SUC] MarekSuchanek/repo1; label4; 771077',
+        '[ADD][SUC] MarekSuchanek/repo1; label2; CCAAFF',
+        '[UPD][ERR] MarekSuchanek/repo1; label3; 00FFXX; 422 - Validation Failed',
+        '[ADD][ERR] MarekSuchanek/repo1; label7; 00FFCCAA; 422 - Validation Failed',
+        '[ADD][SUC] MarekSuchanek/repo2; label1; FFAA00',
+        '[ADD][ERR] MarekSuchanek/repo2; label3; 00FFXX; 422 - Validation Failed',
+        '[ADD][ERR] MarekSuchanek/repo2; label7; 00FFCCAA; 422 - Validation Failed',
+        '[LBL][ERR] MarekSuchanek/repo7; 404 - Not Found',
+        '[SUMMARY] 5 error(s) in total, please check log above',
+        ''
+    ]
+
+
+def test_replace_verbose_graphql(invoker, utils):
+    # Labels are read by two GraphQL queries (second one only for
+    # rest of repo1 labels) and output is the same as with REST
+    invocation = invoker('--config', utils.config('config_errors'),
+                         'run', 'replace', '--verbose', '--graphql',
+                         session_expectations={
+                             'get': 0,
+                             'post': 7,
+                             'patch': 1,
+                             'delete': 1
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert lines == [
+        '[DEL][SUC] MarekSuchanek/repo1; label4; 771077',
+        '[ADD][SUC] MarekSuchanek/repo1; label2; CCAAFF',
+        '[UPD][ERR] MarekSuchanek/repo1; label3; 00FFXX; 422 - Validation Failed',
+        '[ADD][ERR] MarekSuchanek/repo1; label7; 00FFCCAA; 422 - Validation Failed',
+        '[ADD][SUC] MarekSuchanek/repo2; label1; FFAA00',
+        '[ADD][ERR] MarekSuchanek/repo2; label3; 00FFXX; 422 - Validation Failed',
+        '[ADD][ERR] MarekSuchanek/repo2; label7; 00FFCCAA; 422 - Validation Failed',
+        '[LBL][ERR] MarekSuchanek/repo7; 404 - Not Found',
+        '[SUMMARY] 5 error(s) in total, please check log above',
+        ''
+    ]
+
+
+def test_replace_verbose_graphql_enterprise(invoker, utils):
+    # GitHub Enterprise serves GraphQL API at /api/graphql
+    # next to REST API at /api/v3
+    invocation = invoker('--config', utils.config('config_errors'),
+                         '--api-url', 'https://github.example.com/api/v3',
+                         'run', 'replace', '--verbose', '--graphql',
+                         session_expectations={
+                             'get': 0,
+                             'post': 7,
+                             'patch': 1,
+                             'delete': 1
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert lines[0] == '[DEL][SUC] MarekSuchanek/repo1; label4; 771077'
+    assert lines[-3:] == ['[LBL][ERR] MarekSuchanek/repo7; 404 - Not Found',
+                          '[SUMMARY] 5 error(s) in total, please check log above',
+                          '']
+
+
+def test_replace_verbose_graphql_rate_limited(invoker, utils):
+    # Failed GraphQL query is answered with 200 too, with errors
+    # instead of data, repositories are not reported as not found
+    invocation = invoker('--config', utils.config('config_errors'),
+                         'run', 'replace', '--verbose', '--graphql',
+                         session_expectations={
+                             'get': 0,
+                             'post': 1,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert lines == ['GitHub: ERROR RATE_LIMITED - API rate limit exceeded for user ID 32020103.', '']
+
+
 def test_update_quiet_with_errors(invoker, utils):
     invocation = invoker('-c', utils.config('config_errors'),
                          'run', 'update', '-q',
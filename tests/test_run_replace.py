@@ -3,6 +3,8 @@
 # repo2 = [(label2, CCAAFF)]
 # repo3 = [(label4, 666666), (label5, C0B011)]
 # repo4 = []
+import os
+import sqlite3
 
 
 def test_replace_empty_repos(invoker, utils):
@@ -105,6 +107,53 @@ def test_replace_template_repo(invoker, utils):
     assert lines[0] == 'SUMMARY: 2 repo(s) updated successfully'
 
 
+def test_replace_template_snapshot(invoker, utils, cache_dir):
+    # Second run validates stored snapshot of template labels by ETag,
+    # GitHub answers 304 - Not Modified and the snapshot is used
+    # GET: 3 (repo1: 1, repo2: 1, repo3: 1) in each run
+    outputs = []
+    for _ in range(2):
+        invocation = invoker('-c', utils.config('config_templaterepo'),
+                             'run', 'replace', '--dry-run', '--verbose',
+                             session_expectations={
+                                 'get': 3,
+                                 'post': 0,
+                                 'patch': 0,
+                                 'delete': 0
+                             })
+        assert invocation.result.exit_code == 0
+        outputs.append(invocation.result.output)
+
+    connection = sqlite3.connect(os.path.join(cache_dir, 'responses.sqlite'))
+    repos = connection.execute('SELECT repo FROM templates').fetchall()
+    connection.close()
+
+    assert repos == [('MarekSuchanek/repo3',)]
+    assert outputs[0] == outputs[1]
+    assert '[ADD][DRY] MarekSuchanek/repo2; label4; 666666' in outputs[1].split('\n')
+
+
+def test_replace_template_changed(invoker, utils):
+    # Template has changed since the first run, its page
+    # downloaded by validation of snapshot is not requested again
+    # GET: 3 (repo3: 1, repo1: 1, repo2: 1) in each run
+    outputs = []
+    for _ in range(2):
+        invocation = invoker('-c', utils.config('config_templaterepo'),
+                             'run', 'replace', '--dry-run', '--verbose',
+                             session_expectations={
+                                 'get': 3,
+                                 'post': 0,
+                                 'patch': 0,
+                                 'delete': 0
+                             })
+        assert invocation.result.exit_code == 0
+        outputs.append(invocation.result.output.split('\n'))
+
+    assert '[ADD][DRY] MarekSuchanek/repo2; label4; 666666' in outputs[0]
+    assert '[ADD][DRY] MarekSuchanek/repo2; label4; 777777' in outputs[1]
+
+
 def test_replace_with_errors(invoker, utils):
     # GET: 3 (repo1: 1, repo2: 1, repo7: 1)
     # POST: 5 (repo1: 2, repo2: 3)
@@ -1,3 +1,6 @@
+import os
+import subprocess
+import sys
 import pytest
 
 
@@ -183,6 +186,22 @@ def test_version(invoker_norec, isolated):
     assert 'labelord, version 0.1' in invocation.result.output
 
 
+@pytest.mark.parametrize('args', [['--version'], ['--help'], ['run', '--help']])
+def test_startup_lazy_imports(args):
+    # Trivial paths should not import HTTP client and other modules
+    # needed just by commands talking to GitHub (fresh interpreter
+    # is needed, tests have requests imported already)
+    code = ('import sys; sys.argv = ["labelord.py"] + sys.argv[1:]; import labelord\n'
+            'try:\n    labelord.cli(obj={})\nexcept SystemExit:\n    pass\n'
+            'print(" ".join(sorted(m for m in ("requests", "asyncio", "sqlite3", "configparser", '
+            '"concurrent.futures") if m in sys.modules)), file=sys.stderr)')
+    result = subprocess.run([sys.executable, '-c', code] + args, cwd=os.path.join(os.path.dirname(__file__), '..'),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    assert result.returncode == 0
+    assert result.stderr.strip() == ''
+
+
 def test_precedence_template_repo(invoker, utils):
     # repo4 is empty and has higher precedence than repo3
     # in the config
@@ -3,6 +3,8 @@
 # repo2 = [(label2, CCAAFF)]
 # repo3 = [(label4, 666666), (label5, C0B011)]
 # repo4 = []
+import time
+import pytest
 
 
 def test_update_empty_repos(invoker, utils):
@@ -85,6 +87,24 @@ def test_update_all_repos(invoker, utils):
     assert lines[0] == 'SUMMARY: 4 repo(s) updated successfully'
 
 
+def test_update_all_repos_jobs(invoker, utils):
+    # Same as test_update_all_repos but repositories are
+    # processed by several workers at once
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'run', 'update', '-a', '--jobs', '4',
+                         session_expectations={
+                             'get': 5,
+                             'post': 9,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 2 and lines[-1] == ''
+    assert lines[0] == 'SUMMARY: 4 repo(s) updated successfully'
+
+
 def test_update_template_repo(invoker, utils):
     # GET: 3 (repo1: 1, repo2: 1, repo3: 1)
     # POST: 3 (repo1: 1, repo2: 2)
@@ -169,3 +189,297 @@ def test_update_dry_with_errors(invoker, utils):
     assert len(lines) == 3 and lines[-1] == ''
     assert 'ERROR: LBL; MarekSuchanek/repo7; 404 - Not Found' in lines
     assert lines[-2] == 'SUMMARY: 1 error(s) in total, please check log above'
+
+
+def test_update_more_than_hundred_labels(invoker, utils):
+    # repo3 has 154 labels (label0-label153) on two pages,
+    # label150 is on the second page and must not be created
+    # GET: 2 (repo3: 2)
+    # POST: 1 (label154)
+    # PATCH: 1 (label153)
+    invocation = invoker('-c', utils.config('config_manylabels'),
+                         'run', 'update', '--verbose',
+                         session_expectations={
+                             'get': 2,
+                             'post': 1,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 4 and lines[-1] == ''
+    assert '[UPD][SUC] MarekSuchanek/repo3; label153; 000000' in lines
+    assert '[ADD][SUC] MarekSuchanek/repo3; label154; FFFFFF' in lines
+    assert lines[-2] == '[SUMMARY] 1 repo(s) updated successfully'
+
+
+def test_update_unchanged_skipped(invoker, utils):
+    # repo2 already has exactly the configured labels, second run
+    # gets 304 - Not Modified for its labels and skips it
+    invocation = invoker('-c', utils.config('config_insync'),
+                         'run', 'update',
+                         session_expectations={
+                             'get': 1,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['SUMMARY: 1 repo(s) updated successfully', '']
+
+    invocation = invoker('-c', utils.config('config_insync'),
+                         'run', 'update',
+                         session_expectations={
+                             'get': 1,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['SUMMARY: 1 repo(s) updated successfully (0 touched, 1 skipped as unchanged)', '']
+
+
+def test_update_secondary_rate_limit(invoker, utils):
+    # First POST is refused due to secondary rate limit (403 with
+    # Retry-After), it must be repeated instead of reported as error
+    # POST: 4 (repo1: 1 + 1 repeated, repo2: 2)
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'run', 'update', '--verbose',
+                         session_expectations={
+                             'get': 2,
+                             'post': 4,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 6 and lines[-1] == ''
+    assert '[ADD][SUC] MarekSuchanek/repo1; label2; CCAAFF' in lines
+    assert lines[-2] == '[SUMMARY] 2 repo(s) updated successfully'
+
+
+def test_update_secondary_rate_limit_wait(invoker, utils, monkeypatch):
+    # Secondary rate limit with Retry-After: 2 applies to the token,
+    # request has to wait before it is repeated with the same token
+    # POST: 4 (repo1: 1 + 1 repeated, repo2: 2)
+    # sleeping just moves the clock
+    sleeps = []
+    now = time.time
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        monkeypatch.setattr('time.time', lambda: now() + sum(sleeps))
+    monkeypatch.setattr('time.sleep', sleep)
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'run', 'update', '--verbose',
+                         session_expectations={
+                             'get': 2,
+                             'post': 4,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert '[ADD][SUC] MarekSuchanek/repo1; label2; CCAAFF' in lines
+    assert len(sleeps) == 1 and 1.5 < sleeps[0] <= 2
+
+
+def test_secondary_rate_limit_other_token():
+    # Another token is used right away, the limited one is blocked
+    from labelord import TokenPool
+    token_pool = TokenPool(['first', 'second'])
+    token, rate_limiter = token_pool.choose()
+    rate_limiter.block(2)
+
+    assert token_pool.choose()[0] != token
+    assert token_pool.choose()[1].delay() == 0
+    assert 1.5 < rate_limiter.delay() <= 2
+
+
+def test_rate_limit_resources():
+    # GraphQL API has its own rate limit, its headers do not change budget of REST API
+    import requests
+    from labelord import TokenPool
+    token_pool = TokenPool(['first'])
+    response = requests.Response()
+    response.status_code = 200
+    response.headers.update({'X-RateLimit-Resource': 'graphql', 'X-RateLimit-Remaining': '0',
+                             'X-RateLimit-Reset': str(int(time.time()) + 600)})
+    for resource in ('core', 'graphql'):
+        token_pool.choose(resource)[1].update(response)
+
+    assert token_pool.choose('core')[1].budget() == float('inf')
+    assert token_pool.choose('graphql')[1].budget() == 0
+    assert token_pool.remaining() is None
+
+
+@pytest.mark.parametrize(
+    ('value', 'low', 'high'),
+    [
+        ('2', 2, 2),
+        ('-5', 0, 0),
+        ('Wed, 21 Oct 2015 07:28:00 GMT', 0, 0),
+        (None, 4, 5),
+        ('soon', 60, 60),
+    ]
+)
+def test_retry_after(value, low, high):
+    # seconds or HTTP date, None stands for date 5 seconds from now
+    from email.utils import formatdate
+    from labelord import parse_retry_after
+    if value is None:
+        value = formatdate(time.time() + 5, usegmt=True)
+
+    assert low <= parse_retry_after(value) <= high
+
+
+def test_update_transient_error(invoker, utils):
+    # First POST fails with 502 - Bad Gateway, label is checked
+    # to be still missing and POST is repeated
+    # GET: 3 (repo1: 1 + 1 check, repo2: 1)
+    # POST: 4 (repo1: 1 + 1 repeated, repo2: 2)
+    invocation = invoker('--config', utils.config('config_normal'), '--retry-backoff', '0',
+                         'run', 'update', '--verbose',
+                         session_expectations={
+                             'get': 3,
+                             'post': 4,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 6 and lines[-1] == ''
+    assert '[ADD][SUC] MarekSuchanek/repo1; label2; CCAAFF' in lines
+    assert lines[-2] == '[SUMMARY] 2 repo(s) updated successfully (1 request(s) retried)'
+
+
+def test_update_transient_error_color(invoker, utils):
+    # PATCH of label3 color fails with 502 - Bad Gateway, label
+    # still has the old color so PATCH is repeated
+    # GET: 3 (repo1: 1 + 1 check, repo2: 1)
+    # PATCH: 2 (repo1: 1 + 1 repeated)
+    invocation = invoker('--config', utils.config('config_normal'), '--retry-backoff', '0',
+                         'run', 'update', '--verbose',
+                         session_expectations={
+                             'get': 3,
+                             'post': 3,
+                             'patch': 2,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert '[UPD][SUC] MarekSuchanek/repo1; label3; 00FF00' in lines
+    assert lines[-2] == '[SUMMARY] 2 repo(s) updated successfully (1 request(s) retried)'
+
+
+@pytest.mark.parametrize(
+    ('args', 'error', 'summary'),
+    [(['-v'], '[ADD][ERR] MarekSuchanek/repo1; label2; CCAAFF; 502 - Bad Gateway',
+      '[SUMMARY] 1 error(s) in total, please check log above'),
+     ([], 'ERROR: ADD; MarekSuchanek/repo1; label2; CCAAFF; 502 - Bad Gateway',
+      'SUMMARY: 1 error(s) in total, please check log above'),
+     (['-o', 'jsonl'], '{"type":"operation","method":"ADD","repo":"MarekSuchanek/repo1","label":"label2",'
+                       '"color":"CCAAFF","result":"ERR","status":502,"message":"Bad Gateway"}',
+      '{"type":"summary","result":"ERR","repos":2,"errors":1,"skipped":0,"retried":0}')]
+)
+def test_update_transient_error_exhausted(invoker, utils, args, error, summary):
+    # POST fails with 502 - Bad Gateway page of proxy (not JSON)
+    # and there are no retries left, other operations go on
+    # GET: 2 (repo1: 1, repo2: 1)
+    # POST: 3 (repo1: 1, repo2: 2)
+    invocation = invoker('--config', utils.config('config_normal'), '--retries', '0',
+                         'run', 'update', *args,
+                         session_expectations={
+                             'get': 2,
+                             'post': 3,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert error in lines
+    assert lines[-2] == summary
+
+
+def test_update_api_url(invoker, utils):
+    # Same as test_update_normal, but with GitHub Enterprise API
+    # GET: 2 (repo1: 1, repo2: 1)
+    # POST: 3 (repo1: 1, repo2: 2)
+    # PATCH: 1 (repo1: 1, repo2: 0)
+    # DELETE: 0 (update mode)
+    invocation = invoker('--config', utils.config('config_normal'),
+                         '--api-url', 'https://github.example.com/api/v3/',
+                         'run', 'update',
+                         session_expectations={
+                             'get': 2,
+                             'post': 3,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 2 and lines[-1] == ''
+    assert lines[0] == 'SUMMARY: 2 repo(s) updated successfully'
+
+
+def test_update_metrics_file(invoker, utils, tmpdir):
+    # GET: 2 (repo1: 1, repo2: 1)
+    # POST: 3 (repo1: 1, repo2: 2)
+    # PATCH: 1 (repo1: 1, repo2: 0)
+    # DELETE: 0 (update mode)
+    metrics_file = tmpdir.join('labelord.prom')
+    invocation = invoker('--config', utils.config('config_normal'),
+                         'run', 'update', '--metrics-file', str(metrics_file),
+                         session_expectations={
+                             'get': 2,
+                             'post': 3,
+                             'patch': 1,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert len(lines) == 2 and lines[-1] == ''
+    metrics = metrics_file.read().split('\n')
+    assert 'labelord_repos_processed 2' in metrics
+    assert 'labelord_repos_skipped 0' in metrics
+    assert 'labelord_errors 0' in metrics
+    assert 'labelord_operations{method="ADD",result="SUC"} 3' in metrics
+    assert 'labelord_operations{method="UPD",result="SUC"} 1' in metrics
+    assert 'labelord_operations{method="DEL",result="SUC"} 0' in metrics
+    assert 'labelord_http_request_duration_seconds_bucket{endpoint="labels",le="+Inf"} 2' in metrics
+    assert 'labelord_http_request_duration_seconds_count{endpoint="ADD"} 3' in metrics
+    assert metrics[-2:] == ['# EOF', '']
+
+
+def test_update_all_repos_inventory(invoker, utils):
+    # Second run uses stored inventory of repositories
+    # instead of listing them again
+    # GET: 4 (all: 0, repo1: 1, repo2: 1, repo3: 1, repo4: 1)
+    # POST: 0 (dry run)
+    first = invoker('-c', utils.config('config_normal'),
+                    'run', 'update', '-a')
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'run', 'update', '-a', '--dry-run',
+                         session_expectations={
+                             'get': 4,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert first.result.exit_code == 0
+    assert invocation.result.exit_code == 0
+    assert lines == ['SUMMARY: 4 repo(s) updated successfully', '']
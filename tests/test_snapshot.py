@@ -0,0 +1,99 @@
+# Testing snapshot command of labelord and offline dry run
+# which reads labels from the snapshot instead of GitHub
+import json
+import time
+
+
+def test_snapshot_dry_run(invoker, utils, tmpdir):
+    # GET: 2 (repo1: 1, repo2: 1) to take snapshot, none for dry run
+    snapshot_file = str(tmpdir.join('snapshot.json'))
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'snapshot', snapshot_file,
+                         session_expectations={'get': 2})
+
+    assert invocation.result.exit_code == 0
+    assert invocation.result.output == 'SUMMARY: labels of 2 repo(s) captured\n'
+
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'run', 'update', '--dry-run', '--verbose', '--snapshot', snapshot_file,
+                         session_expectations={
+                             'get': 0,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['[SNAPSHOT] labels read from snapshot taken 0 minute(s) ago',
+                     '[UPD][DRY] MarekSuchanek/repo1; label3; 00FF00',
+                     '[ADD][DRY] MarekSuchanek/repo2; label3; 00FF00',
+                     '[SUMMARY] 2 repo(s) updated successfully',
+                     '']
+
+
+def test_snapshot_stale(invoker_norec, utils, tmpdir):
+    # repo2 has not been captured, so it cannot be checked
+    snapshot_file = tmpdir.join('snapshot.json')
+    snapshot_file.write(json.dumps({
+        'created': int(time.time()) - 3 * 24 * 3600,
+        'repos': {'MarekSuchanek/repo1': [{'name': 'label1', 'color': 'FFAA00'}]},
+        'templates': {},
+    }))
+    invocation = invoker_norec('-c', utils.config('config_normal'),
+                               'run', 'replace', '--dry-run', '--snapshot', str(snapshot_file))
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 10
+    assert lines == ['SNAPSHOT: labels read from snapshot taken 3 day(s) ago, it is STALE',
+                     'ERROR: LBL; MarekSuchanek/repo2; 404 - Not Found',
+                     'SUMMARY: 1 error(s) in total, please check log above',
+                     '']
+
+    invocation = invoker_norec('-c', utils.config('config_normal'),
+                               'run', 'replace', '--snapshot', str(snapshot_file))
+    assert invocation.result.exit_code == 2
+
+
+def test_snapshot_offline_no_token(invoker_norec, tmpdir):
+    # offline dry run needs no token and opens no connections (--prewarm)
+    config = tmpdir.join('config.cfg')
+    config.write('[repos]\nMarekSuchanek/repo1 = on\n[labels]\nlabel1 = FFAA00\n')
+    snapshot_file = tmpdir.join('snapshot.json')
+    snapshot_file.write(json.dumps({
+        'created': int(time.time()),
+        'repos': {'MarekSuchanek/repo1': [{'name': 'label1', 'color': 'FFAA00'}]},
+        'templates': {},
+    }))
+    invocation = invoker_norec('-c', str(config), '--prewarm',
+                               'run', 'update', '--dry-run', '--snapshot', str(snapshot_file))
+
+    assert invocation.result.exit_code == 0
+    assert invocation.result.output.split('\n') == ['SNAPSHOT: labels read from snapshot taken 0 minute(s) ago',
+                                                    'SUMMARY: 1 repo(s) updated successfully',
+                                                    '']
+
+
+def test_snapshot_invalid(invoker_norec, utils, tmpdir):
+    snapshot_file = tmpdir.join('snapshot.json')
+    snapshot_file.write(json.dumps({'repos': {}}))
+    invocation = invoker_norec('-c', utils.config('config_normal'),
+                               'run', 'update', '--dry-run', '--snapshot', str(snapshot_file))
+
+    assert invocation.result.exit_code == 2
+    assert 'snapshot has not been written by snapshot command' in invocation.result.output
+
+
+def test_snapshot_template_missing_jsonl(invoker_norec, utils, tmpdir):
+    # missing template ends the run with error record after the snapshot one
+    snapshot_file = tmpdir.join('snapshot.json')
+    snapshot_file.write(json.dumps({'created': int(time.time()), 'repos': {}, 'templates': {}}))
+    invocation = invoker_norec('-c', utils.config('config_normal'),
+                               'run', 'update', '--dry-run', '--snapshot', str(snapshot_file),
+                               '-o', 'jsonl', '-r', 'MarekSuchanek/template')
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 5
+    assert [json.loads(line) for line in lines[:-1]] == [
+        {'type': 'snapshot', 'age': 0, 'stale': False},
+        {'type': 'error', 'message': 'Template repository MarekSuchanek/template is not in snapshot', 'exit': 5}]
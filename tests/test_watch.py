@@ -0,0 +1,43 @@
+# Testing watch command of labelord, every run of watch is done
+# with the same session so unchanged repositories are skipped
+
+
+def test_watch_unchanged_skipped(invoker, utils):
+    # repo2 already has exactly the configured labels, second run
+    # gets 304 - Not Modified for its labels and skips it
+    invocation = invoker('-c', utils.config('config_insync'),
+                         'watch', 'update', '--iterations', '2', '--interval', '0',
+                         session_expectations={
+                             'get': 2,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['SUMMARY: 1 repo(s) updated successfully',
+                     'SUMMARY: 1 repo(s) updated successfully (0 touched, 1 skipped as unchanged)',
+                     '']
+
+
+def test_watch_failed_run(invoker, utils):
+    # GitHub failing with 502 - Bad Gateway does not stop watching,
+    # first run cannot list repositories, second one cannot read labels
+    # GET: 4 (all: 2, repo2: 2)
+    invocation = invoker('-c', utils.config('config_insync'), '--retries', '0',
+                         'watch', 'update', '-a', '--iterations', '3', '--interval', '0',
+                         session_expectations={
+                             'get': 4,
+                             'post': 0,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['Run failed (exited with code 10), watching continues',
+                     'ERROR: LBL; MarekSuchanek/repo2; 502 - Bad Gateway',
+                     'SUMMARY: 1 error(s) in total, please check log above',
+                     'SUMMARY: 1 repo(s) updated successfully',
+                     '']
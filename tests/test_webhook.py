@@ -0,0 +1,139 @@
+# Testing serve-webhook command of labelord, the server is not started,
+# events are delivered by Flask test client instead
+import hashlib
+import hmac
+import json
+import click
+import pytest
+
+flask = pytest.importorskip('flask')
+
+
+SECRET = 'webhookSecret'
+
+
+def label_event(repo_name, action='created'):
+    return 'label', {'action': action, 'repository': {'full_name': repo_name},
+                     'label': {'name': 'label1', 'color': 'FFAA00'}}
+
+
+def deliver(client, event, payload, secret=SECRET):
+    body = json.dumps(payload).encode('utf-8')
+    signature = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return client.post('/', data=body, content_type='application/json',
+                       headers={'X-GitHub-Event': event, 'X-Hub-Signature-256': signature})
+
+
+def test_webhook_signature():
+    from labelord import RepoQueue, create_webhook_app, handle_webhook
+    queue = RepoQueue(0, ['MarekSuchanek/repo1'])
+    handle = lambda event, payload: handle_webhook(event, payload, queue, None)
+    client = create_webhook_app(SECRET, handle).test_client()
+
+    assert deliver(client, *label_event('MarekSuchanek/repo1'), secret='wrongSecret').status_code == 401
+    assert client.post('/', data='{}', headers={'X-GitHub-Event': 'label'}).status_code == 401
+    assert queue.pending == {}
+
+    response = deliver(client, 'ping', {'zen': 'Keep it logically awesome.'})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'pong'
+
+
+def test_webhook_events_coalesced():
+    from labelord import RepoQueue, handle_webhook
+    queue = RepoQueue(60, ['MarekSuchanek/repo1', 'MarekSuchanek/repo2'])
+
+    assert handle_webhook(*label_event('MarekSuchanek/repo1'), queue, None) == 'queued'
+    assert handle_webhook(*label_event('MarekSuchanek/repo1', 'edited'), queue, None) == 'queued'
+    assert handle_webhook(*label_event('MarekSuchanek/other'), queue, None) == 'ignored'
+    assert handle_webhook('push', {'repository': {'full_name': 'MarekSuchanek/repo2'}},
+                          queue, None) == 'ignored'
+    assert sorted(queue.pending) == ['MarekSuchanek/repo1']
+
+    renamed = {'action': 'renamed', 'repository': {'full_name': 'MarekSuchanek/repo3'},
+               'changes': {'repository': {'name': {'from': 'repo2'}}}}
+    assert handle_webhook('repository', renamed, queue, None) == 'queued'
+    assert sorted(queue.pending) == ['MarekSuchanek/repo1', 'MarekSuchanek/repo3']
+    assert queue.repos == {'MarekSuchanek/repo1', 'MarekSuchanek/repo3'}
+
+
+def test_webhook_reconcile(invoker, utils, monkeypatch):
+    # burst of events for repo2 ends in one reconciliation
+    # GET: 1 (repo2: 1)
+    # POST: 2 (repo2: 2)
+    def run(app, **kwargs):
+        client = app.test_client()
+        for _ in range(3):
+            assert deliver(client, *label_event('MarekSuchanek/repo2', 'deleted')).status_code == 200
+        click.get_current_context().obj['webhook_queue'].join()
+
+    monkeypatch.setattr(flask.Flask, 'run', run)
+    invocation = invoker('-c', utils.config('config_normal'),
+                         'serve-webhook', 'update', '-v', '--delay', '0.2', '--secret', SECRET,
+                         session_expectations={
+                             'get': 1,
+                             'post': 2,
+                             'patch': 0,
+                             'delete': 0
+                         })
+    lines = invocation.result.output.split('\n')
+
+    assert invocation.result.exit_code == 0
+    assert lines == ['[ADD][SUC] MarekSuchanek/repo2; label1; FFAA00',
+                     '[ADD][SUC] MarekSuchanek/repo2; label3; 00FF00',
+                     '[SYNC] MarekSuchanek/repo2; updated successfully',
+                     '']
+
+
+def test_webhook_worker_survives_failure(monkeypatch, capsys):
+    # unexpected error while reconciling repo1 is reported
+    # and the only worker goes on with repo2
+    import threading
+    import labelord
+
+    def sync_repo(repo_name, *args):
+        if repo_name == 'MarekSuchanek/repo1':
+            raise ValueError('unexpected response')
+        return 0
+
+    monkeypatch.setattr(labelord, 'sync_repo', sync_repo)
+    queue = labelord.RepoQueue(0, ['MarekSuchanek/repo1', 'MarekSuchanek/repo2'])
+    desired = labelord.DesiredLabels({}, 'update')
+    configuration = {'quiet': False, 'verbose': False, 'output': 'text'}
+    labelord.start_reconcile_workers(1, queue, None, None, desired, configuration, 'update')
+    queue.put('MarekSuchanek/repo1')
+    queue.put('MarekSuchanek/repo2')
+    waiting = threading.Thread(target=queue.join, daemon=True)
+    waiting.start()
+    waiting.join(5)
+
+    assert not waiting.is_alive()
+    assert capsys.readouterr().out.split('\n') == [
+        'SYNC: MarekSuchanek/repo1; failed (ValueError: unexpected response)',
+        'SYNC: MarekSuchanek/repo2; updated successfully',
+        '']
+
+
+def test_webhook_template_refresh_queued(monkeypatch, capsys):
+    # change of template labels is answered right away, template
+    # is read again by worker which then queues the repositories
+    import labelord
+    refreshes = []
+
+    def refresh():
+        refreshes.append(True)
+        return ['MarekSuchanek/repo1']
+
+    monkeypatch.setattr(labelord, 'sync_repo', lambda repo_name, *args: 0)
+    queue = labelord.RepoQueue(0, ['MarekSuchanek/repo1', 'MarekSuchanek/repo2'])
+    event, payload = label_event('MarekSuchanek/template')
+    assert labelord.handle_webhook(event, payload, queue, 'MarekSuchanek/Template') == 'queued'
+    assert refreshes == []
+
+    desired = labelord.DesiredLabels({}, 'update')
+    configuration = {'quiet': False, 'verbose': False, 'output': 'text'}
+    labelord.start_reconcile_workers(1, queue, refresh, None, desired, configuration, 'update')
+    queue.join()
+
+    assert refreshes == [True]
+    assert capsys.readouterr().out.split('\n') == ['SYNC: MarekSuchanek/repo1; updated successfully', '']